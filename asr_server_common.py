@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ASR 模型服务器的公共部分
+JSON 编解码、stdin 命令读取，以及 stdin/stdout 命令协议（合批、分发、响应输出）
+"""
+
+import json
+import logging
+import os
+import select
+import struct
+import time
+
+# orjson 可选：C 实现的 JSON 编解码，未安装时回退到标准库 json
+try:
+    import orjson
+
+    def dumps_json(obj):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    loads_json = orjson.loads
+except ImportError:
+    def dumps_json(obj):
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+    loads_json = json.loads
+
+# 批处理：收到第一条命令后等待后续命令的时间窗口（秒）与单批最大命令数
+BATCH_WINDOW_SECONDS = 0.02
+MAX_BATCH_SIZE = 8
+# stdin 单次读取 / stdout 写缓冲字节数
+IO_BUFFER_SIZE = 65536
+
+logger = logging.getLogger(__name__)
+
+
+class StdinLineReader:
+    """直接基于文件描述符读取 stdin 的行读取器，支持带超时等待下一行以收集批处理命令
+
+    不能混用 sys.stdin.readline 和 select：TextIOWrapper 会预读多行到内部缓冲区，
+    select 看不到这些已缓冲的数据。
+    """
+
+    def __init__(self, stream):
+        self._fd = stream.fileno()
+        self._buffer = b""
+        self._eof = False
+        # Windows 上 select 不支持管道，只能返回已缓冲的完整行，不做等待
+        self._can_wait = os.name != "nt"
+
+    def readline(self, timeout=None):
+        """读取一行；EOF 时返回空字符串，超时仍无完整行时返回 None"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while b"\n" not in self._buffer:
+            if self._eof:
+                line, self._buffer = self._buffer, b""
+                return line.decode("utf-8", errors="replace")
+            if not self._fill(deadline):
+                return None
+        line, _, self._buffer = self._buffer.partition(b"\n")
+        return (line + b"\n").decode("utf-8", errors="replace")
+
+    def _fill(self, deadline):
+        """从 fd 读取一块数据追加到缓冲区；截止时间前没有数据可读时返回 False"""
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if not self._can_wait or remaining <= 0:
+                return False
+            ready, _, _ = select.select([self._fd], [], [], remaining)
+            if not ready:
+                return False
+        chunk = os.read(self._fd, IO_BUFFER_SIZE)
+        if not chunk:
+            self._eof = True
+        self._buffer += chunk
+        return True
+
+
+class StdinFrameReader(StdinLineReader):
+    """长度前缀帧读取器：每条命令为 4 字节大端长度 + UTF-8 JSON（--framing length）"""
+
+    def readline(self, timeout=None):
+        """读取一帧；EOF 时返回空字符串，超时仍无完整帧时返回 None"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if len(self._buffer) >= 4:
+                (size,) = struct.unpack(">I", self._buffer[:4])
+                if len(self._buffer) >= 4 + size:
+                    payload = self._buffer[4 : 4 + size]
+                    self._buffer = self._buffer[4 + size :]
+                    # 空帧按空行处理，不能返回空字符串（那表示 EOF）
+                    return payload.decode("utf-8", errors="replace") or "\n"
+            if self._eof:
+                self._buffer = b""
+                return ""
+            if not self._fill(deadline):
+                return None
+
+
+class CommandServerMixin:
+    """stdin/stdout 命令协议：连续的转录命令合批，其余命令按 _handlers 分发
+
+    子类需提供 transcribe_batch、check_status、get_performance_stats、_cleanup_memory，
+    并在 __init__ 中设置 self.running 和 self._out（run() 中创建的 stdout 写入器）。
+    """
+
+    # IPC 分帧方式：line 为每行一条 JSON，length 为 4 字节大端长度前缀
+    framing = "line"
+    # 命令不是合法 JSON 对象时返回的错误信息（各服务器沿用各自原有的文案）
+    invalid_command_error = "无效的JSON命令"
+
+    def _init_command_handlers(self):
+        """创建命令分发表：action -> 处理函数（转录命令在 _handle_lines 中合批，不经过此表）"""
+        self._handlers = {
+            "status": lambda command: self.check_status(),
+            "stats": self._handle_stats,
+            "cleanup": self._handle_cleanup,
+            "exit": self._handle_exit,
+        }
+
+    def _signal_handler(self, signum, frame):
+        """处理退出信号"""
+        logger.info(f"收到信号 {signum}，准备退出...")
+        self.running = False
+
+    def _handle_lines(self, lines):
+        """按顺序处理一批命令行，连续的转录命令合并为一次批量转录"""
+        results = []
+        transcribe_commands = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                command = loads_json(line)
+            except json.JSONDecodeError:  # orjson.JSONDecodeError 是其子类
+                command = None
+            if not isinstance(command, dict):
+                # 合法 JSON 但不是对象（如 123、"x"、[]）同样视为无效命令
+                command = None
+
+            if command is not None and command.get("action") == "transcribe":
+                transcribe_commands.append(command)
+                continue
+
+            if transcribe_commands:
+                results.extend(self.transcribe_batch(transcribe_commands))
+                transcribe_commands = []
+
+            if command is None:
+                results.append({"success": False, "error": self.invalid_command_error})
+                continue
+
+            results.append(self._execute_command(command))
+            if command.get("action") == "exit":
+                self.running = False
+                break
+
+        if transcribe_commands:
+            results.extend(self.transcribe_batch(transcribe_commands))
+        return results
+
+    def _execute_command(self, command):
+        """处理非转录命令（转录命令由 _handle_lines 合批处理）"""
+        action = command.get("action")
+        handler = self._handlers.get(action)
+        if handler is None:
+            return {"success": False, "error": f"未知命令: {action}"}
+        return handler(command)
+
+    def _handle_stats(self, command):
+        """stats：返回性能统计"""
+        return {"success": True, "stats": self.get_performance_stats()}
+
+    def _handle_cleanup(self, command):
+        """cleanup：清理内存"""
+        self._cleanup_memory()
+        return {"success": True, "message": "内存清理完成"}
+
+    def _handle_exit(self, command):
+        """exit：主循环在 _handle_lines 中据此停止"""
+        return {"success": True, "message": "服务器退出"}
+
+    def _emit(self, result):
+        """写入一条 JSON 响应（仅写入缓冲区，由调用方决定何时 flush）"""
+        payload = dumps_json(result)
+        if self.framing == "length":
+            self._out.write(struct.pack(">I", len(payload)) + payload)
+        else:
+            self._out.write(payload + b"\n")
@@ -6,30 +6,36 @@ FunASR模型下载脚本
 """
 
 import sys
-import json
 import threading
 import time
 
+from setup_common import emit_json, set_download_only_env, snapshot_model
+
+
 def download_model(model_config, progress_callback=None):
     """下载单个模型"""
     model_name = model_config["name"]
     model_type = model_config["type"]
     trust_remote = model_config.get("trust_remote_code", False)
+    revision = None if trust_remote else "v2.0.4"
 
     try:
-        from funasr import AutoModel
-
         if progress_callback:
             progress_callback(model_type, "downloading", 0)
 
-        # 下载模型
-        kwargs = {"model": model_name}
-        if trust_remote:
-            kwargs["trust_remote_code"] = True
-        else:
-            kwargs["model_revision"] = "v2.0.4"
+        # 各模型线程只做网络下载，不在下载线程里各自构建一遍模型；
+        # 没有 modelscope 时再走 AutoModel 触发下载
+        if not snapshot_model(model_name, revision):
+            set_download_only_env()
+            from funasr import AutoModel
 
-        AutoModel(**kwargs)
+            kwargs = {"model": model_name}
+            if trust_remote:
+                kwargs["trust_remote_code"] = True
+            else:
+                kwargs["model_revision"] = revision
+
+            AutoModel(**kwargs)
 
         if progress_callback:
             progress_callback(model_type, "completed", 100)
@@ -66,37 +72,39 @@ def main():
     results = {}
     completed_count = 0
     total_count = len(models)
+    progress_lock = threading.Lock()
     
     def progress_callback(model_type, stage, percent, error=None):
         nonlocal completed_count
         
-        if stage == "downloading":
-            progress[model_type] = percent
-        elif stage == "completed":
-            progress[model_type] = 100
-            completed_count += 1
-        elif stage == "error":
-            progress[model_type] = 0
-            completed_count += 1
-        
-        # 计算总体进度
-        overall_progress = sum(progress.values()) / total_count
-        
-        # 输出进度信息
-        status = {
-            "stage": stage,
-            "model": model_type,
-            "progress": percent,
-            "overall_progress": round(overall_progress, 1),
-            "completed": completed_count,
-            "total": total_count
-        }
-        
+        # 多个下载线程共用进度状态
+        with progress_lock:
+            if stage == "downloading":
+                progress[model_type] = percent
+            elif stage == "completed":
+                progress[model_type] = 100
+                completed_count += 1
+            elif stage == "error":
+                progress[model_type] = 0
+                completed_count += 1
+
+            # 计算总体进度
+            overall_progress = sum(progress.values()) / total_count
+
+            # 输出进度信息
+            status = {
+                "stage": stage,
+                "model": model_type,
+                "progress": percent,
+                "overall_progress": round(overall_progress, 1),
+                "completed": completed_count,
+                "total": total_count
+            }
+
         if error:
             status["error"] = error
-            
-        print(json.dumps(status, ensure_ascii=False))
-        sys.stdout.flush()
+
+        emit_json(status)
     
     # 启动并行下载线程
     threads = []
@@ -130,8 +138,7 @@ def main():
             "results": results
         }
     
-    print(json.dumps(final_result, ensure_ascii=False))
-    sys.stdout.flush()
+    emit_json(final_result)
 
 if __name__ == "__main__":
     try:
@@ -141,5 +148,5 @@ if __name__ == "__main__":
             "success": False,
             "error": str(e)
         }
-        print(json.dumps(error_result, ensure_ascii=False))
+        emit_json(error_result)
         sys.exit(1)
\ No newline at end of file
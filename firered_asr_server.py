@@ -7,17 +7,53 @@ FireRedASR 模型服务器
 """
 
 import sys
-import json
+import gc
+import io
 import os
+import hashlib
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import traceback
 import signal
+import faulthandler
+import queue
 import tempfile
+import importlib.util
 from pathlib import Path
 
+import numpy as np
+import soundfile as sf
+
+from asr_server_common import (
+    CommandServerMixin,
+    StdinLineReader,
+    BATCH_WINDOW_SECONDS,
+    MAX_BATCH_SIZE,
+    IO_BUFFER_SIZE,
+)
+
+# soxr：C++ SIMD 重采样器（librosa 的依赖），用于将非 16kHz 音频转换为模型输入
+try:
+    import soxr
+except ImportError:
+    soxr = None
+
+# librosa 仅作为压缩格式（mp3 等）的时长回退，启动时导入一次，避免在转录热路径中导入
+try:
+    import librosa
+except ImportError:
+    librosa = None
+
+# CUDA 缓存分配器使用可扩展段，减少碎片；显存由分配器在进程生命周期内复用，
+# 不再定期 empty_cache（那会把缓存块还给驱动，下一次推理又要重新 cudaMalloc）
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True,max_split_size_mb:512")
+
 # PyTorch 2.6+ 安全加载兼容性：允许 argparse.Namespace
 # fireredasr pip 包的模型文件使用了 argparse.Namespace 序列化
 import argparse
+import torch
 import torch.serialization
 torch.serialization.add_safe_globals([argparse.Namespace])
 
@@ -48,14 +84,160 @@ logger = logging.getLogger(__name__)
 logger.info(f"FireRedASR 服务器日志文件: {log_file_path}")
 
 
-class FireRedASRServer:
+def _log_cuda_memory_summary(signum, frame):
+    """SIGUSR2：把 CUDA 缓存分配器的显存统计写入日志"""
+    if torch.cuda.is_available():
+        logger.info(f"CUDA 显存统计:\n{torch.cuda.memory_summary()}")
+    else:
+        logger.info("CUDA 不可用，无显存统计")
+
+
+# 崩溃时输出 Python/C 调用栈；运维可通过 kill -USR1 <pid> 随时查看所有线程的调用栈，
+# kill -USR2 <pid> 查看显存占用。平时不产生任何开销
+faulthandler.enable(sys.stderr)
+if hasattr(signal, "SIGUSR1"):
+    faulthandler.register(signal.SIGUSR1, file=sys.stderr, all_threads=True, chain=False)
+    signal.signal(signal.SIGUSR2, _log_cuda_memory_summary)
+
+
+# 标点恢复模型
+PUNC_MODEL_ID = "damo/punc_ct-transformer_zh-cn-common-vocab272727-pytorch"
+# 转录结果缓存条目数
+RESULT_CACHE_SIZE = 64
+# 标点恢复结果缓存条目数
+PUNC_CACHE_SIZE = 256
+# FireRedASR 模型输入采样率
+MODEL_SAMPLE_RATE = 16000
+# 超长音频分片窗口与相邻分片重叠时长（秒）
+CHUNK_SECONDS = 30
+CHUNK_OVERLAP_SECONDS = 0.5
+# 每次批量推理的分片数；分片池需容纳推理中与预取中的两组分片
+CHUNK_BATCH_SIZE = 2
+CHUNK_SLOT_COUNT = 2 * CHUNK_BATCH_SIZE
+# 磁盘上缓存的 fbank 特征文件数
+FEATURE_CACHE_SIZE = 256
+# 计算音频哈希时的读取块大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def default_beam_size(duration):
+    """按音频时长选择默认 beam size：beam search 每步开销与 beam 数成正比，短句贪心解码精度损失很小"""
+    if duration < 5.0:
+        return 1
+    if duration < 20.0:
+        return 3
+    return 5
+
+
+def hash_audio_file(audio_path):
+    """流式计算音频文件内容哈希"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(audio_path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_feature_cache_dir(model_type):
+    """fbank 特征缓存目录，与日志一样放在用户数据目录下；
+    特征经各模型自带的 cmvn.ark 归一化，按模型类型分目录存放"""
+    if "ELECTRON_USER_DATA" in os.environ:
+        cache_dir = os.path.join(os.environ["ELECTRON_USER_DATA"], "cache", "firered_features", model_type)
+    else:
+        cache_dir = os.path.join(tempfile.gettempdir(), "ququ_cache", "firered_features", model_type)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+class CachedFeatExtractor:
+    """包装 FireRedASR 的特征提取器，按音频内容哈希把 fbank 特征缓存为 .npy
+
+    重复识别同一音频（例如换 beam size 重试）时直接从磁盘 mmap 读取特征，跳过特征提取。
+    只缓存调用方通过 content_hashes 给出哈希的音频（用户提交的原始文件）；
+    分片、重采样临时文件和预热音频每次内容都不同，直接提取，不计算哈希也不落盘。
+    """
+
+    def __init__(self, extractor, cache_dir):
+        self._extractor = extractor
+        self._cache_dir = cache_dir
+        # 音频路径 -> 内容哈希，由调用方在每次推理前设置
+        self.content_hashes = {}
+
+    def __call__(self, wav_paths):
+        feats = []
+        durs = []
+        for wav_path in wav_paths:
+            content_hash = self.content_hashes.get(wav_path)
+            if content_hash is None:
+                feats.append(self._extract(wav_path))
+            else:
+                feats.append(self._load_or_extract(wav_path, content_hash))
+            info = sf.info(wav_path)
+            durs.append(info.frames / float(info.samplerate))
+        lengths = torch.tensor([feat.size(0) for feat in feats], dtype=torch.long)
+        feats_pad = torch.nn.utils.rnn.pad_sequence(feats, batch_first=True, padding_value=0.0)
+        return feats_pad, lengths, durs
+
+    def _extract(self, wav_path):
+        feats_pad, lengths, _ = self._extractor([wav_path])
+        return feats_pad[0, : int(lengths[0])]
+
+    def _load_or_extract(self, wav_path, content_hash):
+        feat_path = os.path.join(self._cache_dir, content_hash + ".npy")
+        try:
+            # 写时复制映射：不读入整份数据，且得到可写数组供 torch 使用
+            return torch.from_numpy(np.load(feat_path, mmap_mode="c"))
+        except (FileNotFoundError, ValueError):
+            pass
+
+        feat = self._extract(wav_path)
+        try:
+            tmp_path = f"{feat_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, feat.numpy())
+            os.replace(tmp_path, feat_path)
+            self._prune()
+        except OSError as e:
+            logger.warning(f"特征缓存写入失败: {str(e)}")
+        return feat
+
+    def _prune(self):
+        """缓存文件超过上限时删除最旧的条目"""
+        entries = [e for e in os.scandir(self._cache_dir) if e.name.endswith(".npy")]
+        if len(entries) <= FEATURE_CACHE_SIZE:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[: len(entries) - FEATURE_CACHE_SIZE]:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+
+class FireRedASRServer(CommandServerMixin):
+    invalid_command_error = "无效的 JSON 命令"
+
     def __init__(self, model_type="aed", device=None):
         self.model = None
         self.punc_model = None  # 标点恢复模型
+        self._punc_onnx = None  # 可选的 onnxruntime int8 标点模型（QUQU_PUNC_ONNX=1 启用）
         self.initialized = False
         self.running = True
         self.transcription_count = 0
         self.total_audio_duration = 0.0
+        self._next_audio_id = 0
+        self._out = None  # stdout 写入器，run() 中创建
+
+        # 结果缓存：音频内容哈希 -> 转录结果，重复提交同一音频时跳过 ASR 和标点恢复
+        self._result_cache = OrderedDict()
+        self._punc_cache = functools.lru_cache(maxsize=PUNC_CACHE_SIZE)(self._run_punc)
+
+        # 分片预取线程：推理当前分片时准备下一个分片
+        self._chunk_prefetcher = ThreadPoolExecutor(max_workers=1)
+        # 标点恢复线程：批量转录时与后续 ASR 推理并行
+        self._punc_pool = ThreadPoolExecutor(max_workers=1)
+        # 分片池：复用临时文件和采样缓冲区，避免每个分片都创建文件、分配内存
+        self._chunk_slots = self._create_chunk_slots()
 
         # 模型类型：aed (1.1B, 高效) 或 llm (8.3B, 最强)
         self.model_type = model_type
@@ -64,48 +246,58 @@ class FireRedASRServer:
         if device:
             self.device = device
         else:
-            import torch
             self.device = "cuda" if torch.cuda.is_available() else "cpu"
 
         logger.info(f"FireRedASR 将使用设备: {self.device}, 模型类型: {self.model_type}")
 
+        self._init_command_handlers()
+
         signal.signal(signal.SIGTERM, self._signal_handler)
         signal.signal(signal.SIGINT, self._signal_handler)
 
-    def _signal_handler(self, signum, frame):
-        logger.info(f"收到信号 {signum}，准备退出...")
-        self.running = False
-
     def initialize(self):
         """初始化 FireRedASR 模型"""
         if self.initialized:
             return {"success": True, "message": "模型已初始化"}
 
         try:
-            import torch
-
             logger.info(f"使用设备: {self.device}, 模型类型: {self.model_type}")
 
+            if librosa is not None:
+                self._cache_audioread_backends()
+
             from fireredasr.models.fireredasr import FireRedAsr
 
             logger.info("加载 FireRedASR 模型（首次运行会自动下载）...")
             self.model = FireRedAsr.from_pretrained(self.model_type)
+            if hasattr(self.model, "feat_extractor"):
+                self.model.feat_extractor = CachedFeatExtractor(
+                    self.model.feat_extractor, get_feature_cache_dir(self.model_type)
+                )
+
+            if self.device == "cuda":
+                self._optimize_cuda_inference()
 
             # 加载标点恢复模型（FireRedASR 不支持标点输出，需要后处理）
             logger.info("加载标点恢复模型...")
             try:
                 from funasr import AutoModel
                 self.punc_model = AutoModel(
-                    model="damo/punc_ct-transformer_zh-cn-common-vocab272727-pytorch",
+                    model=PUNC_MODEL_ID,
                     model_revision="v2.0.4",
                     disable_update=True,
                     device=self.device,  # 使用与 ASR 模型相同的设备
                 )
+                if os.environ.get("QUQU_PUNC_ONNX") == "1":
+                    self._punc_onnx = self._load_onnx_punc_model()
+                if self.device == "cpu" and self._punc_onnx is None:
+                    self._quantize_punc_model()
                 logger.info(f"标点恢复模型加载完成 (设备: {self.device})")
             except Exception as e:
                 logger.warning(f"标点恢复模型加载失败，将不添加标点: {str(e)}")
                 self.punc_model = None
 
+            self._warmup()
             self.initialized = True
 
             # 获取 GPU 信息
@@ -134,6 +326,83 @@ class FireRedASRServer:
             logger.error(traceback.format_exc())
             return {"success": False, "error": error_msg, "type": "init_error"}
 
+    def _warmup(self):
+        """用 1 秒静音预热推理，把 cuDNN 算法选择、torch.compile 编译等首次开销移到启动阶段"""
+        slot = self._chunk_slots.get()
+        try:
+            sf.write(slot["path"], np.zeros(MODEL_SAMPLE_RATE, dtype=np.float32), MODEL_SAMPLE_RATE, subtype="PCM_16")
+            self._transcribe_file(slot["path"], {"use_gpu": 1 if self.device == "cuda" else 0, "beam_size": 3})
+            if self.punc_model:
+                self._run_punc("测试")
+            logger.info("模型预热完成")
+        except Exception as e:
+            logger.warning(f"模型预热失败: {str(e)}")
+        finally:
+            self._chunk_slots.put(slot)
+
+    def _cache_audioread_backends(self):
+        """缓存 audioread 后端列表，避免 librosa 回退路径每次加载都重新探测后端"""
+        try:
+            import audioread
+
+            backends = tuple(audioread.available_backends())
+            audioread.available_backends = lambda flush_cache=False: backends
+            logger.info(f"audioread 后端已缓存: {[b.__name__ for b in backends]}")
+        except Exception as e:
+            logger.warning(f"audioread 后端缓存失败: {str(e)}")
+
+    def _optimize_cuda_inference(self):
+        """CUDA 推理优化：启用 TF32 矩阵乘，并用 torch.compile 编译编码器"""
+
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+        torch.set_float32_matmul_precision("high")
+
+        # Inductor 的 CUDA 后端依赖 triton，缺失时（如 Windows）编译会在首次推理时才报错
+        if importlib.util.find_spec("triton") is None:
+            logger.info("未安装 triton，跳过 torch.compile")
+            return
+
+        # 解码器走 beam search 方法而非 forward，编译只对编码器生效
+        # 音频长度每次不同，使用 dynamic=True 避免按形状反复重编译
+        asr_module = getattr(self.model, "model", None)
+        encoder = getattr(asr_module, "encoder", None)
+        if isinstance(encoder, torch.nn.Module):
+            try:
+                asr_module.encoder = torch.compile(encoder, dynamic=True, fullgraph=False)
+                logger.info("编码器已启用 torch.compile")
+            except Exception as e:
+                logger.warning(f"torch.compile 失败，使用 eager 模式: {str(e)}")
+
+    def _load_onnx_punc_model(self):
+        """导出标点模型为 int8 ONNX 并用 onnxruntime 加载，失败时返回 None 继续使用 PyTorch 模型"""
+        try:
+            from funasr_onnx import CT_Transformer
+
+            # 目录中没有 model_quant.onnx 时，funasr_onnx 会先调用 funasr 导出并量化
+            model_dir = getattr(self.punc_model, "model_path", None) or PUNC_MODEL_ID
+            punc_onnx = CT_Transformer(
+                model_dir,
+                quantize=True,
+                device_id=0 if self.device == "cuda" else -1,
+                intra_op_num_threads=4,
+            )
+            logger.info("标点恢复模型已切换为 onnxruntime int8")
+            return punc_onnx
+        except Exception as e:
+            logger.warning(f"ONNX 标点模型加载失败，使用 PyTorch 模型: {str(e)}")
+            return None
+
+    def _quantize_punc_model(self):
+        """CPU 上将标点模型的 Linear 层动态量化为 int8"""
+        try:
+            self.punc_model.model = torch.quantization.quantize_dynamic(
+                self.punc_model.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            logger.info("标点恢复模型已量化为 int8")
+        except Exception as e:
+            logger.warning(f"标点恢复模型量化失败，使用 FP32: {str(e)}")
+
     def transcribe_audio(self, audio_path, options=None):
         """转录音频文件"""
         if not self.initialized:
@@ -142,99 +411,366 @@ class FireRedASRServer:
                 return init_result
 
         try:
-            import librosa
+            job = self._prepare_job(audio_path, options)
+            if "result" in job:
+                return job["result"]
+            return self._run_job(job)
+        except Exception as e:
+            return self._transcription_error(e)
 
-            if not os.path.exists(audio_path):
-                return {"success": False, "error": f"音频文件不存在: {audio_path}"}
+    def transcribe_batch(self, commands):
+        """批量转录：未超长的音频按推理参数分组、按时长排序后合并为一次模型调用，结果按请求顺序返回"""
+        if len(commands) == 1:
+            command = commands[0]
+            return [self.transcribe_audio(command.get("audio_path"), command.get("options", {}))]
 
-            logger.info(f"开始转录音频文件: {audio_path}")
+        if not self.initialized:
+            init_result = self.initialize()
+            if not init_result["success"]:
+                return [init_result] * len(commands)
 
-            # 获取音频时长
-            duration = librosa.get_duration(filename=audio_path)
+        results = [None] * len(commands)
+        groups = {}
+        for i, command in enumerate(commands):
+            try:
+                job = self._prepare_job(command.get("audio_path"), command.get("options", {}))
+                if "result" in job:
+                    results[i] = job["result"]
+                elif job["duration"] > job["max_duration"] or job["needs_resample"]:
+                    # 超长音频走分片流程、非 16kHz 单声道音频需先重采样，均不参与合批
+                    results[i] = self._run_job(job)
+                else:
+                    group_key = tuple(sorted(job["decode_args"].items()))
+                    groups.setdefault(group_key, []).append((i, job))
+            except Exception as e:
+                results[i] = self._transcription_error(e)
+
+        pending = []
+        for group in groups.values():
+            # 按时长排序，使同批音频长度接近，减少 padding 带来的无效计算
+            group.sort(key=lambda item: item[1]["duration"])
+            audio_paths = [job["audio_path"] for _, job in group]
+            content_hashes = {job["audio_path"]: job["cache_key"][0] for _, job in group}
+            logger.info(f"合批转录 {len(audio_paths)} 个音频")
+            try:
+                transcripts = self._transcribe_files(
+                    audio_paths, group[0][1]["decode_args"], content_hashes
+                )
+            except Exception as e:
+                for i, _ in group:
+                    results[i] = self._transcription_error(e)
+                continue
+
+            # 标点恢复提交到后台线程，与下一组的 ASR 推理重叠，组装响应时再取结果
+            for (i, job), transcript in zip(group, transcripts):
+                punc_future = None
+                if self.punc_model and transcript.strip():
+                    punc_future = self._punc_pool.submit(self._restore_punctuation, transcript.strip())
+                pending.append((i, job, transcript, punc_future))
+
+        for i, job, transcript, punc_future in pending:
+            try:
+                results[i] = self._finish_job(job, transcript, punc_future)
+            except Exception as e:
+                results[i] = self._transcription_error(e)
 
-            # FireRedASR-AED 最长支持 60s，FireRedASR-LLM 最长支持 30s
-            max_duration = 60 if self.model_type == "aed" else 30
-            if duration > max_duration:
-                logger.warning(f"音频时长 {duration:.1f}s 超过限制 {max_duration}s，将进行分片处理")
-
-            # 生成唯一 ID
-            import uuid
-            audio_id = str(uuid.uuid4())[:8]
-
-            # 设置推理参数
-            use_gpu = 1 if self.device == "cuda" else 0
-            beam_size = options.get("beam_size", 3) if options else 3
-
-            # 执行推理
-            results = self.model.transcribe(
-                [audio_id],
-                [audio_path],
-                {
-                    "use_gpu": use_gpu,
-                    "beam_size": beam_size,
-                }
-            )
+        return results
 
-            # 提取结果
-            if results and len(results) > 0:
-                result_item = results[0]
-                if isinstance(result_item, dict):
-                    transcript = result_item.get("text", "")
-                elif isinstance(result_item, (list, tuple)) and len(result_item) > 1:
-                    transcript = result_item[1]  # (id, text) 格式
-                else:
-                    transcript = str(result_item)
-            else:
-                transcript = ""
-
-            raw_text = transcript.strip()
-
-            # 标点恢复（FireRedASR 不输出标点，需要后处理）
-            final_text = raw_text
-            if self.punc_model and raw_text:
-                try:
-                    punc_result = self.punc_model.generate(input=raw_text)
-                    if isinstance(punc_result, list) and len(punc_result) > 0:
-                        if isinstance(punc_result[0], dict) and "text" in punc_result[0]:
-                            final_text = punc_result[0]["text"]
-                        else:
-                            final_text = str(punc_result[0])
-                    logger.info("标点恢复完成")
-                except Exception as e:
-                    logger.warning(f"标点恢复失败，使用原始文本: {str(e)}")
+    def _prepare_job(self, audio_path, options):
+        """校验音频并确定时长与推理参数；文件不存在或命中缓存时直接在 "result" 中给出结果"""
+        if not os.path.exists(audio_path):
+            return {"result": {"success": False, "error": f"音频文件不存在: {audio_path}"}}
+
+        logger.info(f"开始转录音频文件: {audio_path}")
+
+        # 获取音频时长（只解析文件头，不解码音频流）
+        duration, needs_resample = self._probe_audio(audio_path)
 
+        # 设置推理参数：未指定 beam_size 时按时长自适应，短句用贪心解码
+        decode_args = {
+            "use_gpu": 1 if self.device == "cuda" else 0,
+            "beam_size": (options or {}).get("beam_size") or default_beam_size(duration),
+        }
+
+        cache_key = (hash_audio_file(audio_path), decode_args["beam_size"])
+        cached = self._result_cache.get(cache_key)
+        if cached is not None:
+            self._result_cache.move_to_end(cache_key)
             self.transcription_count += 1
             self.total_audio_duration += duration
+            logger.info(f"命中转录结果缓存: {audio_path}")
+            return {"result": dict(cached)}
 
-            result = {
-                "success": True,
-                "text": final_text,
-                "raw_text": raw_text,
-                "duration": duration,
-                "language": "auto",  # FireRedASR 自动检测语言
-                "model_type": f"firered-asr-{self.model_type}",
-            }
+        return {
+            "audio_path": audio_path,
+            "duration": duration,
+            # FireRedASR-AED 最长支持 60s，FireRedASR-LLM 最长支持 30s
+            "max_duration": 60 if self.model_type == "aed" else 30,
+            "decode_args": decode_args,
+            "cache_key": cache_key,
+            "needs_resample": needs_resample,
+        }
 
-            # 定期清理 GPU 缓存
-            if self.transcription_count % 10 == 0:
-                self._cleanup_memory()
-                logger.info(f"已完成 {self.transcription_count} 次转录，执行内存清理")
+    def _run_job(self, job):
+        """执行单个转录任务，超长音频进行分片处理"""
+        audio_path = job["audio_path"]
+        if job["duration"] > job["max_duration"]:
+            logger.warning(
+                f"音频时长 {job['duration']:.1f}s 超过限制 {job['max_duration']}s，将进行分片处理"
+            )
+            transcript = self._transcribe_chunked(audio_path, job["decode_args"])
+            job["chunked"] = True
+        elif job["needs_resample"]:
+            slot = self._resample_to_slot(audio_path)
+            try:
+                transcript = self._transcribe_file(slot["path"], job["decode_args"])
+            finally:
+                self._chunk_slots.put(slot)
+        else:
+            transcript = self._transcribe_file(
+                audio_path, job["decode_args"], content_hash=job["cache_key"][0]
+            )
+        return self._finish_job(job, transcript)
+
+    def _finish_job(self, job, transcript, punc_future=None):
+        """标点恢复、更新统计与结果缓存，生成最终响应；punc_future 为已提交的后台标点任务"""
+        raw_text = transcript.strip()
+
+        # 标点恢复（FireRedASR 不输出标点，需要后处理）
+        final_text = raw_text
+        if punc_future is not None:
+            final_text = punc_future.result()
+        elif self.punc_model and raw_text:
+            final_text = self._restore_punctuation(raw_text)
+
+        self.transcription_count += 1
+        self.total_audio_duration += job["duration"]
+
+        result = {
+            "success": True,
+            "text": final_text,
+            "raw_text": raw_text,
+            "duration": job["duration"],
+            "language": "auto",  # FireRedASR 自动检测语言
+            "model_type": f"firered-asr-{self.model_type}",
+            "beam_size_used": job["decode_args"]["beam_size"],
+        }
+        if job.get("chunked"):
+            # 分片转录前面已流式输出 partial 事件，最终结果标记为 complete
+            result["type"] = "complete"
+
+        self._result_cache[job["cache_key"]] = dict(result)
+        if len(self._result_cache) > RESULT_CACHE_SIZE:
+            self._result_cache.popitem(last=False)
+
+        logger.info(f"转录完成: {final_text[:100]}...")
+        return result
+
+    def _transcription_error(self, e):
+        """记录转录异常并生成错误响应"""
+        error_msg = f"音频转录失败: {str(e)}"
+        logger.error(error_msg)
+        logger.error(traceback.format_exc())
+        return {"success": False, "error": error_msg, "type": "transcription_error"}
+
+    def _probe_audio(self, audio_path):
+        """读取音频时长，并判断是否需要转换为 16kHz 单声道；soundfile 无法识别的格式回退到 librosa 取时长"""
+        try:
+            info = sf.info(audio_path)
+        except sf.SoundFileError:
+            if librosa is None:
+                raise
+            return librosa.get_duration(path=audio_path), False
+
+        needs_resample = soxr is not None and (
+            info.samplerate != MODEL_SAMPLE_RATE or info.channels > 1
+        )
+        return info.frames / float(info.samplerate), needs_resample
+
+    def _to_model_input(self, frames, sr):
+        """将 (帧数, 声道) 采样转换为模型需要的 16kHz 单声道"""
+        if frames.shape[1] > 1:
+            frames = frames.mean(axis=1)
+        else:
+            frames = frames[:, 0]
+        if sr != MODEL_SAMPLE_RATE and soxr is not None:
+            frames = soxr.resample(frames, sr, MODEL_SAMPLE_RATE, quality="HQ")
+            sr = MODEL_SAMPLE_RATE
+        return frames, sr
+
+    def _resample_to_slot(self, audio_path):
+        """读取整个音频，转换为 16kHz 单声道后写入分片池中的临时文件"""
+        frames, sr = sf.read(audio_path, dtype="float32", always_2d=True)
+        frames, sr = self._to_model_input(frames, sr)
+        slot = self._chunk_slots.get()
+        try:
+            sf.write(slot["path"], frames, sr, subtype="PCM_16")
+        except BaseException:
+            self._chunk_slots.put(slot)
+            raise
+        return slot
+
+    def _transcribe_file(self, audio_path, decode_args, content_hash=None):
+        """对单个音频文件执行 ASR 推理，返回识别文本"""
+        content_hashes = {audio_path: content_hash} if content_hash else None
+        return self._transcribe_files([audio_path], decode_args, content_hashes)[0]
+
+    def _transcribe_files(self, audio_paths, decode_args, content_hashes=None):
+        """对一批音频文件执行一次 ASR 推理，按输入顺序返回识别文本
+
+        content_hashes: 音频路径 -> 已计算的内容哈希，仅这些音频使用特征缓存
+        """
+        audio_ids = [self._new_audio_id() for _ in audio_paths]
+
+        feat_extractor = getattr(self.model, "feat_extractor", None)
+        cache_features = isinstance(feat_extractor, CachedFeatExtractor) and content_hashes
+        if cache_features:
+            feat_extractor.content_hashes = content_hashes
+        try:
+            # 执行推理（inference_mode 下不记录 autograd 信息）
+            with torch.inference_mode():
+                results = self.model.transcribe(audio_ids, audio_paths, decode_args)
+        finally:
+            if cache_features:
+                feat_extractor.content_hashes = {}
+
+        # 提取结果，按音频 ID 对应回输入顺序
+        texts = {}
+        for position, result_item in enumerate(results or []):
+            if isinstance(result_item, dict):
+                texts[result_item.get("uttid", audio_ids[position])] = result_item.get("text", "")
+            elif isinstance(result_item, (list, tuple)) and len(result_item) > 1:
+                texts[result_item[0]] = result_item[1]  # (id, text) 格式
+            else:
+                texts[audio_ids[position]] = str(result_item)
+        return [texts.get(audio_id, "") for audio_id in audio_ids]
+
+    def _new_audio_id(self):
+        """生成进程内唯一的音频 ID（单调计数，无需读取系统随机源）"""
+        self._next_audio_id += 1
+        return f"a{self._next_audio_id}"
 
-            logger.info(f"转录完成: {final_text[:100]}...")
-            return result
+    def _transcribe_chunked(self, audio_path, decode_args):
+        """将超长音频按固定窗口（带重叠）分块流式读取，逐块识别后拼接文本"""
+        try:
+            audio_file = sf.SoundFile(audio_path)
+        except sf.SoundFileError as e:
+            # soundfile 无法解码的格式只能整体提交
+            logger.warning(f"无法分块读取音频，整体转录: {str(e)}")
+            return self._transcribe_file(audio_path, decode_args)
+
+        transcripts = []
+        with audio_file:
+            chunk_frames = int(CHUNK_SECONDS * audio_file.samplerate)
+            overlap_frames = int(CHUNK_OVERLAP_SECONDS * audio_file.samplerate)
+            # 相邻分片起点间隔 chunk - overlap；落在上一分片重叠区内的尾部不再单独成片
+            starts = iter(range(0, max(audio_file.frames - overlap_frames, 1), chunk_frames - overlap_frames))
+
+            # 当前一组分片推理期间，后台线程预读并写出下一组分片，使磁盘 I/O 与推理重叠
+            pending = self._chunk_prefetcher.submit(
+                self._write_next_chunks, audio_file, starts, chunk_frames
+            )
+            chunk_idx = 0
+            try:
+                while slots := pending.result():
+                    pending = self._chunk_prefetcher.submit(
+                        self._write_next_chunks, audio_file, starts, chunk_frames
+                    )
+                    # 同组分片等长（仅最后一片可能更短），合并为一次批量推理
+                    try:
+                        texts = self._transcribe_files([slot["path"] for slot in slots], decode_args)
+                    finally:
+                        for slot in slots:
+                            self._chunk_slots.put(slot)
+                    for text in texts:
+                        text = text.strip()
+                        logger.info(f"分片 {chunk_idx} 识别完成: {text[:50]}")
+                        self._emit_partial(audio_path, chunk_idx, text)
+                        if text:
+                            transcripts.append(text)
+                        chunk_idx += 1
+            finally:
+                # 推理出错时归还已预取但未使用的分片
+                if pending.exception() is None:
+                    for slot in pending.result():
+                        self._chunk_slots.put(slot)
+
+        return " ".join(transcripts)
+
+    def _write_next_chunks(self, audio_file, starts, chunk_frames):
+        """读取至多 CHUNK_BATCH_SIZE 个后续分片，分别写入池化临时 WAV 文件；音频读完时返回空列表"""
+        slots = []
+        try:
+            while len(slots) < CHUNK_BATCH_SIZE:
+                start = next(starts, None)
+                if start is None:
+                    break
 
+                slot = self._chunk_slots.get()
+                slots.append(slot)
+                buffer = slot["buffer"]
+                if buffer is None or buffer.shape[0] < chunk_frames or buffer.shape[1] != audio_file.channels:
+                    buffer = slot["buffer"] = np.empty((chunk_frames, audio_file.channels), dtype=np.float32)
+
+                audio_file.seek(start)
+                frames = audio_file.read(
+                    chunk_frames, dtype="float32", always_2d=True, out=buffer[:chunk_frames]
+                )
+                frames, sr = self._to_model_input(frames, audio_file.samplerate)
+                sf.write(slot["path"], frames, sr, subtype="PCM_16")
+            return slots
+        except BaseException:
+            for slot in slots:
+                self._chunk_slots.put(slot)
+            raise
+
+    def _create_chunk_slots(self):
+        """预创建分片用的临时文件与采样缓冲区，跨请求复用"""
+        slots = queue.Queue()
+        for _ in range(CHUNK_SLOT_COUNT):
+            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
+                slots.put({"path": tmp.name, "buffer": None})
+        return slots
+
+    def _remove_chunk_slots(self):
+        """删除分片池中的临时文件"""
+        while not self._chunk_slots.empty():
+            slot = self._chunk_slots.get_nowait()
+            try:
+                os.unlink(slot["path"])
+            except OSError:
+                pass
+
+    def _restore_punctuation(self, raw_text):
+        """对识别文本做标点恢复，失败时返回原始文本"""
+        try:
+            final_text = self._punc_cache(raw_text)
+            logger.info("标点恢复完成")
+            return final_text
         except Exception as e:
-            error_msg = f"音频转录失败: {str(e)}"
-            logger.error(error_msg)
-            logger.error(traceback.format_exc())
-            return {"success": False, "error": error_msg, "type": "transcription_error"}
+            logger.warning(f"标点恢复失败，使用原始文本: {str(e)}")
+            return raw_text
+
+    def _run_punc(self, raw_text):
+        """执行标点模型推理（结果由 _punc_cache 缓存，异常不会被缓存）"""
+        if self._punc_onnx is not None:
+            return self._punc_onnx(raw_text)[0]
+
+        if self.device == "cuda":
+            with torch.autocast("cuda", dtype=torch.float16):
+                punc_result = self.punc_model.generate(input=raw_text)
+        else:
+            punc_result = self.punc_model.generate(input=raw_text)
+
+        if isinstance(punc_result, list) and len(punc_result) > 0:
+            if isinstance(punc_result[0], dict) and "text" in punc_result[0]:
+                return punc_result[0]["text"]
+            return str(punc_result[0])
+        return raw_text
 
     def _cleanup_memory(self):
-        """清理内存和 GPU 缓存"""
+        """清理内存和 GPU 缓存（仅由 cleanup 命令显式触发）"""
         try:
-            import gc
-            import torch
-
             gc.collect()
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
@@ -245,8 +781,6 @@ class FireRedASRServer:
     def check_status(self):
         """检查服务状态"""
         try:
-            import torch
-
             status = {
                 "success": True,
                 "initialized": self.initialized,
@@ -282,58 +816,46 @@ class FireRedASRServer:
             "model_type": self.model_type,
         }
 
+    def _emit_partial(self, audio_path, chunk_idx, text):
+        """分片转录时立即输出一条 partial 事件，客户端无需等待整段音频识别完成"""
+        if self._out is None:
+            return
+        self._emit({"type": "partial", "audio_path": audio_path, "chunk_idx": chunk_idx, "text": text})
+        self._out.flush()
+
     def run(self):
         """运行服务器主循环"""
         logger.info("FireRedASR 服务器启动")
 
+        # 直接写 stdout 文件描述符，使用 64 KiB 缓冲，减少 write 系统调用
+        self._out = io.BufferedWriter(
+            io.FileIO(sys.stdout.fileno(), "wb", closefd=False), buffer_size=IO_BUFFER_SIZE
+        )
+
         # 启动时初始化模型
         init_result = self.initialize()
-        print(json.dumps(init_result, ensure_ascii=False))
-        sys.stdout.flush()
+        self._emit(init_result)
+        self._out.flush()
 
+        reader = StdinLineReader(sys.stdin)
         while self.running:
             try:
-                line = sys.stdin.readline()
+                line = reader.readline()
                 if not line:
                     break
 
-                line = line.strip()
-                if not line:
-                    continue
-
-                try:
-                    command = json.loads(line)
-                except json.JSONDecodeError:
-                    result = {"success": False, "error": "无效的 JSON 命令"}
-                    print(json.dumps(result, ensure_ascii=False))
-                    sys.stdout.flush()
-                    continue
-
-                # 处理命令
-                if command.get("action") == "transcribe":
-                    audio_path = command.get("audio_path")
-                    options = command.get("options", {})
-                    result = self.transcribe_audio(audio_path, options)
-                elif command.get("action") == "status":
-                    result = self.check_status()
-                elif command.get("action") == "stats":
-                    result = {"success": True, "stats": self.get_performance_stats()}
-                elif command.get("action") == "cleanup":
-                    self._cleanup_memory()
-                    result = {"success": True, "message": "内存清理完成"}
-                elif command.get("action") == "exit":
-                    result = {"success": True, "message": "服务器退出"}
-                    print(json.dumps(result, ensure_ascii=False))
-                    sys.stdout.flush()
-                    break
-                else:
-                    result = {
-                        "success": False,
-                        "error": f"未知命令: {command.get('action')}",
-                    }
+                # 收到第一条命令后，在批处理窗口内继续收集已到达的命令
+                lines = [line]
+                while len(lines) < MAX_BATCH_SIZE:
+                    next_line = reader.readline(timeout=BATCH_WINDOW_SECONDS)
+                    if not next_line:
+                        break
+                    lines.append(next_line)
 
-                print(json.dumps(result, ensure_ascii=False))
-                sys.stdout.flush()
+                # 整批响应写入缓冲区后只 flush 一次
+                for result in self._handle_lines(lines):
+                    self._emit(result)
+                self._out.flush()
 
             except KeyboardInterrupt:
                 break
@@ -343,15 +865,14 @@ class FireRedASRServer:
                     "error": str(e),
                     "traceback": traceback.format_exc(),
                 }
-                print(json.dumps(error_result, ensure_ascii=False))
-                sys.stdout.flush()
+                self._emit(error_result)
+                self._out.flush()
 
+        self._remove_chunk_slots()
         logger.info("FireRedASR 服务器退出")
 
 
 if __name__ == "__main__":
-    import argparse
-
     parser = argparse.ArgumentParser(description="FireRedASR 语音识别服务器")
     parser.add_argument(
         "--model-type",
@@ -1,3 +1,4 @@
+import contextlib
 import json
 import logging
 import os
@@ -18,9 +19,37 @@ from funasr.utils.load_utils import extract_fbank, load_audio_text_image_video
 from transformers import AutoConfig, AutoModelForCausalLM
 from transformers.modeling_utils import no_init_weights
 
+try:
+    import soundfile as sf
+except ImportError:
+    sf = None
+
+# torch < 2.3 没有 torch.nn.attention.sdpa_kernel，此时不限定 SDPA kernel
+try:
+    from torch.nn.attention import SDPBackend, sdpa_kernel
+except ImportError:
+    SDPBackend = sdpa_kernel = None
+
 dtype_map = {"bf16": torch.bfloat16, "fp16": torch.float16, "fp32": torch.float32}
 
 
+# 提示模板分词缓存条目数（超出后整体清空）
+ENCODE_CACHE_SIZE = 1024
+# 静态 KV cache 长度分桶粒度（token）
+STATIC_CACHE_BUCKET = 256
+# 提示中的语音占位片段
+SPEECH_SPAN_PATTERN = re.compile(r"(<\|startofspeech\|>.*?<\|endofspeech\|>)")
+
+
+def audio_token_length(n_frames):
+    """fbank 帧数 -> 音频占位 token 数
+
+    等价于两层 kernel=3, stride=2, padding=1 卷积后再按 2 合并：
+    ceil(ceil(ceil(n / 2) / 2) / 2) = ceil(n / 8)
+    """
+    return (n_frames + 7) // 8
+
+
 @tables.register("model_classes", "FunASRNano")
 class FunASRNano(nn.Module):
     def __init__(
@@ -71,7 +100,9 @@ class FunASRNano(nn.Module):
         init_param_path = llm_conf.get("init_param_path", None)
         llm_dim = None
 
-        llm_load_kwargs = llm_conf.get("load_kwargs", {})
+        llm_load_kwargs = dict(llm_conf.get("load_kwargs", {}))
+        # 注意力走 PyTorch SDPA（flash / memory-efficient kernel），配置中显式指定时以配置为准
+        llm_load_kwargs.setdefault("attn_implementation", "sdpa")
         config = AutoConfig.from_pretrained(init_param_path)
         # 使用 no_init_weights 跳过权重初始化，因为后续会加载预训练权重
         # 这可以将模型构建时间从 ~13s 降到 ~0.3s
@@ -136,6 +167,20 @@ class FunASRNano(nn.Module):
 
         self.length_normalized_loss = length_normalized_loss
         self.feat_permute = audio_encoder_conf.get("feat_permute", True)
+        # 在模型设备上计算 fbank，失败一次后回退到 CPU
+        self.fbank_on_device = True
+        # H2D 拷贝专用的 CUDA 流，首次使用时创建
+        self._copy_stream = None
+        # 分桶长度 -> 复用的 StaticCache（llm_kwargs 指定 cache_implementation="static" 时使用）
+        self._static_caches = {}
+        # 提示文本片段 -> token id 列表
+        self._encode_cache = {}
+        # generate 时只允许 flash / memory-efficient SDPA kernel，无可用 kernel 时关闭
+        self.fused_sdpa_only = True
+        # 半精度音频特征的常驻设备缓冲区，按需倍增
+        self._speech_buf = None
+        # generate 的结束/填充 token 参数，首次推理时由 tokenizer 解析
+        self._stop_token_kwargs = None
         rank = int(os.environ.get("RANK", 0))
         logging.info(f"rank: {rank}, model is builded.")
 
@@ -297,18 +342,70 @@ class FunASRNano(nn.Module):
 
         return contents
 
+    def _extract_fbank(self, data_src, frontend, **kwargs):
+        """在模型所在设备上计算 fbank：CUDA 上省去 CPU 端 STFT/梅尔计算和特征的 H2D 拷贝，
+        失败时记录日志并此后一直回退到 CPU"""
+        device = str(kwargs.get("device", "cpu"))
+        data_type = kwargs.get("data_type", "sound")
+        if self.fbank_on_device and device.startswith("cuda"):
+            try:
+                return extract_fbank(
+                    torch.as_tensor(data_src).to(device, non_blocking=True),
+                    data_type=data_type,
+                    frontend=frontend,
+                    is_final=True,
+                )
+            except Exception as e:
+                logging.warning(f"fbank on {device} failed, falling back to cpu: {str(e)}")
+                self.fbank_on_device = False
+        return extract_fbank(
+            data_src, data_type=data_type, frontend=frontend, is_final=True
+        )
+
+    @staticmethod
+    def _load_wav(data_src, fs, **kwargs):
+        """本地音频文件且采样率与前端一致时直接用 soundfile 解码（一次 C 调用得到 float32），
+        其余情况（重采样、URL、非 libsndfile 格式）交给 funasr 的通用加载流程"""
+        if sf is not None and isinstance(data_src, str) and os.path.isfile(data_src):
+            # 先只读文件头判断采样率，需要重采样时不做一次白白丢弃的完整解码
+            try:
+                data = None
+                if sf.info(data_src).samplerate == fs:
+                    data, _ = sf.read(data_src, dtype="float32", always_2d=True)
+            except Exception:
+                data = None
+            if data is not None:
+                wav = torch.from_numpy(data.T)
+                return wav.mean(0) if wav.shape[0] > 1 else wav[0]
+        return load_audio_text_image_video(data_src, fs=fs, **kwargs)
+
+    def _encode(self, tokenizer, text):
+        """缓存提示模板片段的分词结果：系统提示、"语音转写：" 等片段每次请求都相同，
+        返回的列表只读，调用方只做拼接"""
+        token_ids = self._encode_cache.get(text)
+        if token_ids is None:
+            if len(self._encode_cache) >= ENCODE_CACHE_SIZE:
+                self._encode_cache.clear()
+            token_ids = self._encode_cache[text] = tokenizer.encode(text)
+        return token_ids
+
     def data_load_speech(
         self, contents: dict, tokenizer, frontend, meta_data={}, **kwargs
     ):
         system = contents["system"]
         user = contents["user"]
         assistant = contents["assistant"]
-        pattern = re.compile(r"(<\|startofspeech\|>.*?<\|endofspeech\|>)")
         do_think = True
         sys_prompt = True
         if "dataset_conf" in kwargs:
             do_think = kwargs["dataset_conf"].get("do_think", True)
             sys_prompt = kwargs["dataset_conf"].get("sys_prompt", True)
+        # 循环内不变的配置和方法先取到局部变量
+        multiturn_num_max = kwargs.get("multiturn_num_max", 5)
+        max_token_length = kwargs.get("max_token_length", 1500)
+        infer_with_assistant_input = kwargs.get("infer_with_assistant_input", False)
+        encode = self._encode
+        fs = frontend.fs
 
         input_ids, labels, fbank, fbank_lens, fbank_mask, fbank_beg, fake_token_len = (
             [],
@@ -323,14 +420,14 @@ class FunASRNano(nn.Module):
         for i, (system_prompt, user_prompt, target_out) in enumerate(
             zip(system, user, assistant)
         ):
-            if i >= kwargs.get("multiturn_num_max", 5):
+            if i >= multiturn_num_max:
                 break
-            if len(input_ids) > kwargs.get("max_token_length", 1500):
+            if len(input_ids) > max_token_length:
                 break
             if isinstance(user_prompt, (list, tuple)):
                 user_prompt, audio = user_prompt
             if i == 0:
-                if kwargs.get("infer_with_assistant_input", False):
+                if infer_with_assistant_input:
                     source_input = f"<|im_start|>system\n{system_prompt}<|im_end|>\n<|im_start|>user\n{user_prompt}"
                     if not sys_prompt:
                         source_input = f"<|im_start|>user\n{user_prompt}"
@@ -339,14 +436,14 @@ class FunASRNano(nn.Module):
                     if not sys_prompt:
                         source_input = f"<|im_start|>user\n{user_prompt}<|im_end|>\n<|im_start|>assistant\n"
             else:
-                if kwargs.get("infer_with_assistant_input", False):
+                if infer_with_assistant_input:
                     source_input = f"<|im_start|>user\n{user_prompt}"
                 else:
                     source_input = f"<|im_start|>user\n{user_prompt}<|im_end|>\n<|im_start|>assistant\n"
             if not do_think:
                 source_input += "<think>\n\n</think>\n\n"
 
-            splits = pattern.split(source_input)
+            splits = SPEECH_SPAN_PATTERN.split(source_input)
             source_ids = []
             fbank_mask_i = []
             fake_token_len_i = 0
@@ -354,7 +451,7 @@ class FunASRNano(nn.Module):
             speech, speech_lengths = [], []
             for k, sub_str in enumerate(splits):
                 if not sub_str.startswith("<|startofspeech|>"):
-                    sub_token = tokenizer.encode(sub_str)
+                    sub_token = encode(tokenizer, sub_str)
                     source_ids += sub_token
                     fbank_mask_i += [0] * len(sub_token)
                 else:
@@ -367,9 +464,7 @@ class FunASRNano(nn.Module):
                             sub_str = audio
                         try:
                             time1 = time.perf_counter()
-                            data_src = load_audio_text_image_video(
-                                sub_str, fs=frontend.fs, **kwargs
-                            )
+                            data_src = self._load_wav(sub_str, fs, **kwargs)
                             time2 = time.perf_counter()
                             meta_data["load_data"] = f"{time2 - time1:0.3f}"
                         except Exception as e:
@@ -377,11 +472,8 @@ class FunASRNano(nn.Module):
                                 f"Loading wav failed! {str(e)}, {traceback.format_exc()}"
                             )
 
-                        speech, speech_lengths = extract_fbank(
-                            data_src,
-                            data_type=kwargs.get("data_type", "sound"),
-                            frontend=frontend,
-                            is_final=True,
+                        speech, speech_lengths = self._extract_fbank(
+                            data_src, frontend, **kwargs
                         )  # speech: [b, T, d]
 
                         time3 = time.perf_counter()
@@ -396,9 +488,7 @@ class FunASRNano(nn.Module):
                         if self.feat_permute:
                             speech = speech.permute(0, 2, 1)
 
-                        olens = 1 + (speech_lengths[0].item() - 3 + 2 * 1) // 2
-                        olens = 1 + (olens - 3 + 2 * 1) // 2
-                        fake_token_len_i = (olens - 1) // 2 + 1
+                        fake_token_len_i = audio_token_length(speech_lengths[0].item())
                         fake_token = [0] * fake_token_len_i
                         fbank_beg_i = len(source_ids)
                         source_ids += fake_token
@@ -408,7 +498,7 @@ class FunASRNano(nn.Module):
             fake_token_len += [fake_token_len_i]
             source_mask = [-100] * len(source_ids)
             target_out = f"{target_out}<|im_end|>"
-            target_ids = tokenizer.encode(target_out)
+            target_ids = encode(tokenizer, target_out)
             input_source_ids = input_ids + source_ids
             input_ids += source_ids + target_ids
             labels += source_mask + target_ids
@@ -454,6 +544,56 @@ class FunASRNano(nn.Module):
 
         return output
 
+    def _to_device(self, batch, device):
+        """把 batch 中的 CPU 张量搬到 device：CUDA 上经锁页内存在独立拷贝流上异步传输，
+        同 dtype 的小张量先拼进一块锁页暂存区，每种 dtype 只发起一次 H2D 拷贝，
+        计算流只在真正使用前等待拷贝完成"""
+        if not str(device).startswith("cuda"):
+            return to_device(batch, device)
+        if self._copy_stream is None:
+            self._copy_stream = torch.cuda.Stream(device=device)
+        current_stream = torch.cuda.current_stream(device)
+        moved = dict(batch)
+        groups = {}
+        for name, value in batch.items():
+            if isinstance(value, torch.Tensor) and value.device.type == "cpu":
+                groups.setdefault(value.dtype, []).append(name)
+        with torch.cuda.stream(self._copy_stream):
+            for dtype, names in groups.items():
+                tensors = [batch[name] for name in names]
+                staging = torch.empty(
+                    sum(t.numel() for t in tensors), dtype=dtype, pin_memory=True
+                )
+                torch.cat([t.reshape(-1) for t in tensors], out=staging)
+                staged = staging.to(device, non_blocking=True)
+                # 张量在拷贝流上分配、在计算流上使用，告知缓存分配器避免提前复用
+                staged.record_stream(current_stream)
+                offset = 0
+                for name, t in zip(names, tensors):
+                    moved[name] = staged[offset : offset + t.numel()].view(t.shape)
+                    offset += t.numel()
+        current_stream.wait_stream(self._copy_stream)
+        return moved
+
+    def _cast_speech(self, speech, dtype):
+        """把 fbank 转成半精度：CUDA 上写入常驻缓冲区而不是每次新分配，
+        容量不足时按 2 倍扩容，减少缓存分配器的抖动和碎片"""
+        if speech.device.type != "cuda":
+            return speech.to(dtype)
+        numel = speech.numel()
+        buf = self._speech_buf
+        if (
+            buf is None
+            or buf.dtype != dtype
+            or buf.device != speech.device
+            or buf.numel() < numel
+        ):
+            capacity = numel if buf is None else max(numel, 2 * buf.numel())
+            buf = self._speech_buf = torch.empty(
+                capacity, dtype=dtype, device=speech.device
+            )
+        return buf[:numel].view(speech.shape).copy_(speech)
+
     def inference_prepare(
         self,
         data_in,
@@ -472,7 +612,7 @@ class FunASRNano(nn.Module):
         output = self.data_load_speech(
             contents, tokenizer, frontend, meta_data=meta_data, **kwargs
         )
-        batch = to_device(output, kwargs["device"])
+        batch = self._to_device(output, kwargs["device"])
 
         # audio encoder
         speech = batch["speech"]
@@ -485,9 +625,9 @@ class FunASRNano(nn.Module):
                 speech_lengths = batch["speech_lengths"][:, 0]
                 # fp16
                 if kwargs.get("fp16", False):
-                    speech = speech.to(torch.float16)
+                    speech = self._cast_speech(speech, torch.float16)
                 elif kwargs.get("bf16", False):
-                    speech = speech.to(torch.bfloat16)
+                    speech = self._cast_speech(speech, torch.bfloat16)
                 # audio encoder
                 encoder_out, encoder_out_lens = self.encode(speech, speech_lengths)
 
@@ -623,9 +763,17 @@ class FunASRNano(nn.Module):
             inputs_embeds = inputs_embeds.to(dtype_map[llm_dtype])
             llm_kwargs = kwargs.get("llm_kwargs", {})
             if not kwargs.get("teachforing", False):
-                generated_ids = self.llm.generate(
+                max_new_tokens = kwargs.get("max_length", 512)
+                if llm_kwargs.get("cache_implementation") == "static":
+                    llm_kwargs = self._static_cache_kwargs(
+                        llm_kwargs,
+                        inputs_embeds.shape[1] + max_new_tokens,
+                        dtype_map[llm_dtype],
+                    )
+                llm_kwargs = {"use_cache": True, **self._stop_tokens(tokenizer), **llm_kwargs}
+                generated_ids = self._generate(
                     inputs_embeds=inputs_embeds,
-                    max_new_tokens=kwargs.get("max_length", 512),
+                    max_new_tokens=max_new_tokens,
                     **llm_kwargs,
                 )
 
@@ -679,6 +827,77 @@ class FunASRNano(nn.Module):
 
         return results, meta_data
 
+    def _stop_tokens(self, tokenizer):
+        """显式给出 eos_token_id（含对话结束符 <|im_end|>）和 pad_token_id，
+        短音频在输出结束符后立即停止，不跑满 max_new_tokens"""
+        if self._stop_token_kwargs is None:
+            eos_ids = []
+            for token_id in (
+                tokenizer.convert_tokens_to_ids("<|im_end|>"),
+                tokenizer.eos_token_id,
+            ):
+                if isinstance(token_id, int) and token_id != tokenizer.unk_token_id:
+                    if token_id not in eos_ids:
+                        eos_ids.append(token_id)
+            stop_kwargs = {}
+            if eos_ids:
+                stop_kwargs["eos_token_id"] = eos_ids
+                pad_token_id = tokenizer.pad_token_id
+                stop_kwargs["pad_token_id"] = (
+                    pad_token_id if pad_token_id is not None else eos_ids[0]
+                )
+            self._stop_token_kwargs = stop_kwargs
+        return self._stop_token_kwargs
+
+    def _sdpa_context(self, device):
+        """CUDA 上把 SDPA 限定为 flash / memory-efficient kernel，避免长音频前缀退回 math 实现"""
+        if sdpa_kernel is None or not self.fused_sdpa_only or device.type != "cuda":
+            return contextlib.nullcontext()
+        return sdpa_kernel([SDPBackend.FLASH_ATTENTION, SDPBackend.EFFICIENT_ATTENTION])
+
+    def _generate(self, **generate_kwargs):
+        """llm.generate，融合 SDPA kernel 不支持当前输入时记录日志并改用默认 kernel 重试"""
+        device = generate_kwargs["inputs_embeds"].device
+        try:
+            with self._sdpa_context(device):
+                return self.llm.generate(**generate_kwargs)
+        except RuntimeError as e:
+            if not self.fused_sdpa_only or "kernel" not in str(e):
+                raise
+            logging.warning(f"fused SDPA unavailable, using default kernels: {str(e)}")
+            self.fused_sdpa_only = False
+            cache = generate_kwargs.get("past_key_values")
+            if cache is not None and hasattr(cache, "reset"):
+                cache.reset()
+            return self.llm.generate(**generate_kwargs)
+
+    def _static_cache_kwargs(self, llm_kwargs, max_cache_len, dtype):
+        """静态 KV cache 按长度分桶复用：cache 形状只有少数几种，
+        reduce-overhead 编译捕获的 CUDA Graph 可在不同长度的请求之间重放"""
+        bucket = -(-max_cache_len // STATIC_CACHE_BUCKET) * STATIC_CACHE_BUCKET
+        cache = self._static_caches.get(bucket)
+        try:
+            if cache is None:
+                from transformers import StaticCache
+
+                cache = StaticCache(
+                    config=self.llm.config,
+                    max_batch_size=1,
+                    max_cache_len=bucket,
+                    device=self.llm.device,
+                    dtype=dtype,
+                )
+                self._static_caches[bucket] = cache
+            else:
+                cache.reset()
+        except Exception as e:
+            # 构造失败时退回 generate 自行分配的静态 cache
+            logging.warning(f"StaticCache bucket {bucket} unavailable: {str(e)}")
+            return llm_kwargs
+        llm_kwargs = {k: v for k, v in llm_kwargs.items() if k != "cache_implementation"}
+        llm_kwargs["past_key_values"] = cache
+        return llm_kwargs
+
     @staticmethod
     def from_pretrained(model: str = None, **kwargs):
         from funasr import AutoModel
@@ -7,24 +7,43 @@ FunASR模型服务器
 """
 
 import sys
-import json
 import os
 import logging
 import traceback
 import signal
-import contextlib
-import io
 import argparse
-import glob
+import fnmatch
+import gc
+import importlib.util
+import io
+import re
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from types import MappingProxyType
+
+import numpy as np
+
+from asr_server_common import (
+    CommandServerMixin,
+    StdinFrameReader,
+    StdinLineReader,
+    BATCH_WINDOW_SECONDS,
+    MAX_BATCH_SIZE,
+    IO_BUFFER_SIZE,
+)
+
+# soundfile（librosa 的依赖）只读文件头即可得到时长，启动时导入一次
+try:
+    import soundfile as sf
+except ImportError:
+    sf = None
 
 # 项目根目录
 _project_root = Path(__file__).parent
 
-# 设置日志
-import tempfile
-import os
-
 
 # 获取日志文件路径
 def get_log_path():
@@ -52,36 +71,107 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 线程数需在导入 torch 之前设置才会生效
+os.environ["OMP_NUM_THREADS"] = "4"
+
+# 重量级依赖在日志配置完成后导入一次；缺失时保留为 None，由调用处给出明确错误
+try:
+    import torch
+except ImportError:
+    torch = None
+
+try:
+    import torchaudio
+except ImportError:
+    torchaudio = None
+
+try:
+    import funasr
+    from funasr import AutoModel
+except ImportError:
+    funasr = None
+    AutoModel = None
+
+# librosa 仅作为 soundfile 无法识别格式时的时长回退
+try:
+    import librosa
+except ImportError:
+    librosa = None
+
 # 记录日志文件位置
 logger.info(f"FunASR服务器日志文件: {log_file_path}")
 
 
-import threading
-
-# 线程锁用于 stdout 重定向
-_stdout_lock = threading.Lock()
-
-@contextlib.contextmanager
-def suppress_stdout():
-    """
-    上下文管理器：临时重定向stdout到devnull，避免FunASR库的非JSON输出干扰IPC通信
-    线程安全版本
-    """
-    with _stdout_lock:
-        old_stdout = sys.stdout
-        devnull = open(os.devnull, "w")
-        try:
-            sys.stdout = devnull
-            yield
-        finally:
-            sys.stdout = old_stdout
-            devnull.close()
-
-
-class FunASRServer:
-    def __init__(self, damo_root=None):
+# 判断模型目录已下载就绪的文件名模式，合并为一个正则
+MODEL_FILE_PATTERN = re.compile(
+    "|".join(
+        fnmatch.translate(pattern)
+        for pattern in (
+            "model.pt", "pytorch_model.bin", "*.onnx",
+            "config.json", "configuration.json", "model.yaml", "vocab*",
+        )
+    )
+)
+# 模型输入采样率
+MODEL_SAMPLE_RATE = 16000
+# 解码后 PCM 缓存条目数（同一文件重复转录时跳过解码），不小于 MAX_BATCH_SIZE
+PCM_CACHE_SIZE = 8
+# PCM 缓冲池：按 30 秒（16kHz）为粒度分桶，超过 10 分钟的音频不入池
+PCM_BUCKET_SAMPLES = MODEL_SAMPLE_RATE * 30
+PCM_POOL_MAX_SAMPLES = MODEL_SAMPLE_RATE * 600
+PCM_POOL_BUFFERS_PER_BUCKET = 2
+# CUDA 缓存分配器中空闲（已保留未分配）显存超过该值时才归还给驱动
+CUDA_CACHE_SLACK_BYTES = 2 * 1024 ** 3
+
+
+class Float32Pool:
+    """float32 波形缓冲池：按容量分桶复用预分配的数组，超长音频直接分配新数组"""
+
+    def __init__(self):
+        self._buckets = {}
+
+    def acquire(self, n):
+        """返回容量不小于 n 的一维 float32 数组（调用方只使用前 n 个元素）"""
+        capacity = -(-max(n, 1) // PCM_BUCKET_SAMPLES) * PCM_BUCKET_SAMPLES
+        if capacity > PCM_POOL_MAX_SAMPLES:
+            return np.empty(n, dtype=np.float32)
+        bucket = self._buckets.get(capacity)
+        if bucket:
+            return bucket.pop()
+        return np.empty(capacity, dtype=np.float32)
+
+    def release(self, buffer):
+        """归还数组；不属于任何分桶或分桶已满时交给 GC"""
+        if buffer is None or len(buffer) % PCM_BUCKET_SAMPLES or len(buffer) > PCM_POOL_MAX_SAMPLES:
+            return
+        bucket = self._buckets.setdefault(len(buffer), [])
+        if len(bucket) < PCM_POOL_BUFFERS_PER_BUCKET:
+            bucket.append(buffer)
+
+
+class FunASRServer(CommandServerMixin):
+    # 默认转录选项（只读）
+    # Fun-ASR-Nano-2512 模型已经自带标点输出，不需要额外的 punc 模型
+    _DEFAULT_OPTIONS = MappingProxyType({
+        "batch_size_s": 60,
+        "hotword": "",
+        "language": "zh",
+    })
+
+    def __init__(self, damo_root=None, framing="line", debug=False, quant="none"):
         self.asr_model = None
-        self.vad_model = None
+        self._cuda_available = None  # _has_cuda 的缓存结果
+        self.dtype = "fp32"  # 推理精度，CUDA 上为 fp16（前馈层量化后为 fp16+int8），CPU 量化后为 int8
+        self._llm_kwargs = {}  # 透传给 LLM generate 的参数
+        # generate 的流式状态缓存：复用同一个 dict，每次调用后清空，避免状态跨请求累积
+        self._asr_cache = {}
+        # 解码后的 PCM：(路径, 大小, mtime_ns) -> (波形张量, 时长, 缓冲池数组)
+        self._pcm_cache = OrderedDict()
+        self._pcm_pool = Float32Pool()
+        # 源采样率 -> torchaudio 重采样器
+        self._resamplers = {}
+        # 批量转录时的音频解码线程，与 GPU 推理重叠
+        self._prefetcher = ThreadPoolExecutor(max_workers=1)
         self.initialized = False
         self.running = True
         self.transcription_count = 0
@@ -89,149 +179,179 @@ class FunASRServer:
 
         # 外部传入的 damo 根目录（例如 /Volumes/APFS/AI/models/damo）
         self.damo_root = damo_root or os.environ.get("DAMO_ROOT")
+        # IPC 分帧方式：line 为每行一条 JSON，length 为 4 字节大端长度前缀
+        self.framing = framing
+        self._out = None  # stdout 写入器，run() 中创建
+        self.debug = debug  # 调试模式：错误响应附带 traceback
+        self.quant = quant  # 权重量化：none 或 int8
+
+        self._init_command_handlers()
 
         signal.signal(signal.SIGTERM, self._signal_handler)
         signal.signal(signal.SIGINT, self._signal_handler)
-        self._setup_runtime_environment()
-
-    def _setup_runtime_environment(self):
-        """设置运行时环境变量以优化性能"""
-        try:
-            import os
-
-            # 设置线程数优化
-            os.environ["OMP_NUM_THREADS"] = "4"
-            logger.info("运行时环境变量设置完成")
-        except Exception as e:
-            logger.warning(f"环境设置失败: {str(e)}")
-
-    def _signal_handler(self, signum, frame):
-        """处理退出信号"""
-        logger.info(f"收到信号 {signum}，准备退出...")
-        self.running = False
 
     def _has_cuda(self):
-        """检查是否有可用的 CUDA GPU"""
-        try:
-            import torch
-            return torch.cuda.is_available()
-        except ImportError:
-            return False
+        """检查是否有可用的 CUDA GPU（只探测一次驱动，结果缓存在实例上）"""
+        if self._cuda_available is None:
+            self._cuda_available = torch is not None and torch.cuda.is_available()
+        return self._cuda_available
 
     def _load_asr_model(self):
-        """加载ASR模型（在子线程中运行，不使用 suppress_stdout）"""
+        """加载ASR模型"""
         try:
             device = "cuda" if self._has_cuda() else "cpu"
             logger.info(f"开始加载ASR模型... (设备: {device})")
-            from funasr import AutoModel
+
+            if device == "cuda":
+                # TF32 矩阵乘 + cuDNN 自动选择卷积算法，权重与激活使用 fp16
+                torch.backends.cuda.matmul.allow_tf32 = True
+                torch.backends.cudnn.allow_tf32 = True
+                torch.backends.cudnn.benchmark = True
+                self.dtype = "fp16"
 
             # Fun-ASR-Nano-2512 新模型（使用本地优化过的 model.py）
+            # VAD 模型挂在 AutoModel 内部，VAD 切分 → ASR 识别在一次 generate 中完成
             model_py_path = str(_project_root / "funasr_model.py")
             self.asr_model = AutoModel(
                 model="FunAudioLLM/Fun-ASR-Nano-2512",
                 trust_remote_code=True,
                 remote_code=model_py_path,
+                vad_model="damo/speech_fsmn_vad_zh-cn-16k-common-pytorch",
+                vad_model_revision="v2.0.4",
+                vad_kwargs={"max_single_segment_time": 30000},
                 disable_update=True,
                 device=device,
+                fp16=self.dtype == "fp16",
             )
-            logger.info(f"ASR模型加载完成 (设备: {device})")
+            if self.quant == "int8" and device == "cuda":
+                self._quantize_llm_ffn()
+            elif device == "cpu" and (self.quant == "int8" or os.environ.get("QUQU_CPU_INT8") == "1"):
+                self._quantize_asr_model()
+            if device == "cuda" and os.environ.get("QUQU_CUDA_GRAPHS") == "1":
+                self._enable_cuda_graphs()
+            if device == "cuda":
+                self._compile_audio_encoder()
+            logger.info(f"ASR模型加载完成 (设备: {device}, 精度: {self.dtype})")
             return True
         except Exception as e:
-            logger.error(f"ASR模型加载失败: {str(e)}")
+            logger.exception(f"ASR模型加载失败: {str(e)}")
             return False
 
-    def _load_vad_model(self):
-        """加载VAD模型（在子线程中运行，不使用 suppress_stdout）"""
+    def _quantize_asr_model(self):
+        """CPU 上将音频编码器和 LLM 的 Linear 层动态量化为 int8（权重缩小约 4 倍，可用 VNNI 指令）"""
+        try:
+            torch.quantization.quantize_dynamic(
+                self.asr_model.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+            )
+            self.dtype = "int8"
+            logger.info("ASR模型已量化为 int8")
+        except Exception as e:
+            logger.warning(f"ASR模型量化失败，使用 FP32: {str(e)}")
+
+    def _quantize_llm_ffn(self):
+        """CUDA 上将 LLM 前馈层（mlp）的权重量化为 int8（weight-only），注意力层保持 fp16；
+        解码阶段受权重读取带宽限制，前馈层权重占大头"""
         try:
-            logger.info("开始加载VAD模型...")
-            from funasr import AutoModel
+            from torchao.quantization import int8_weight_only, quantize_
 
-            self.vad_model = AutoModel(
-                model="damo/speech_fsmn_vad_zh-cn-16k-common-pytorch",
-                model_revision="v2.0.4",
-                disable_update=True,
-                device="cpu",
+            quantize_(
+                self.asr_model.model.llm,
+                int8_weight_only(),
+                filter_fn=lambda module, fqn: isinstance(module, torch.nn.Linear) and ".mlp." in f".{fqn}",
             )
-            logger.info("VAD模型加载完成")
+            self.dtype = "fp16+int8"
+            logger.info("LLM 前馈层已量化为 int8")
+        except Exception as e:
+            logger.warning(f"LLM 前馈层量化失败，使用 {self.dtype}: {str(e)}")
+
+    def _enable_cuda_graphs(self):
+        """LLM 解码使用静态 KV cache，并以 reduce-overhead 模式编译 forward，
+        每个 token 的解码步骤由 CUDA Graph 重放，省去逐个 kernel 的 Python 启动开销。
+        torch.compile 是惰性的，编译错误要到首次调用才出现，所以在这里先跑一次短推理，
+        失败则恢复原 forward 并使用普通解码"""
+        llm = self.asr_model.model.llm
+        original_forward = llm.forward
+        try:
+            llm.forward = torch.compile(original_forward, mode="reduce-overhead", fullgraph=False)
+            self._llm_kwargs = {"cache_implementation": "static"}
+            self._infer_silence(seconds=1, max_length=2)
+            logger.info("已启用 CUDA Graph 解码（静态 KV cache）")
+        except Exception as e:
+            llm.forward = original_forward
+            self._llm_kwargs = {}
+            logger.warning(f"CUDA Graph 解码启用失败，使用普通解码: {str(e)}")
+
+    def _compile_audio_encoder(self):
+        """用 torch.compile 融合音频编码器中的逐元素/归一化算子（需要 triton）"""
+        if importlib.util.find_spec("triton") is None:
+            logger.info("未安装 triton，跳过音频编码器编译")
+            return False
+        try:
+            model = self.asr_model.model
+            # 输入长度随音频变化，dynamic=True 避免每个新长度都重新编译
+            model.audio_encoder = torch.compile(model.audio_encoder, dynamic=True)
+            logger.info("音频编码器已启用 torch.compile")
             return True
         except Exception as e:
-            logger.error(f"VAD模型加载失败: {str(e)}")
+            logger.warning(f"音频编码器编译失败，使用 eager 模式: {str(e)}")
             return False
 
+    def _infer_silence(self, seconds, max_length):
+        """用静音直接跑一次模型推理（绕过 VAD，否则静音不会送进模型），异常向上抛出"""
+        silence = torch.zeros(MODEL_SAMPLE_RATE * seconds)
+        # AutoModel.inference 会把额外参数合并进 kwargs，传副本避免污染模型配置
+        self.asr_model.inference(
+            silence,
+            model=self.asr_model.model,
+            kwargs=dict(self.asr_model.kwargs),
+            llm_kwargs=self._llm_kwargs,
+            max_length=max_length,
+        )
+
+    def _warmup(self):
+        """用 5 秒静音跑一次模型推理"""
+        try:
+            start_time = time.time()
+            self._infer_silence(seconds=5, max_length=8)
+            logger.info(f"模型预热完成，耗时: {time.time() - start_time:.2f}秒")
+        except Exception as e:
+            logger.warning(f"模型预热失败: {str(e)}")
+
     def initialize(self):
-        """并行初始化FunASR模型"""
+        """初始化FunASR模型"""
         if self.initialized:
             return {"success": True, "message": "模型已初始化"}
 
-        try:
-            import threading
-            import time
+        if AutoModel is None:
+            error_msg = "FunASR未安装，请先安装FunASR: pip install funasr"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg, "type": "import_error"}
 
-            logger.info("正在并行初始化FunASR模型...")
+        try:
+            logger.info("正在初始化FunASR模型...")
             start_time = time.time()
 
-            # 创建加载结果存储
-            results = {}
-
-            def load_model_thread(model_name, load_func):
-                """模型加载线程包装函数"""
-                thread_start = time.time()
-                results[model_name] = load_func()
-                thread_time = time.time() - thread_start
-                logger.info(f"{model_name}模型加载线程耗时: {thread_time:.2f}秒")
-
-            # 创建并启动两个并行线程（Fun-ASR-Nano-2512 已自带标点，不需要 punc 模型）
-            threads = [
-                threading.Thread(
-                    target=load_model_thread, args=("asr", self._load_asr_model)
-                ),
-                threading.Thread(
-                    target=load_model_thread, args=("vad", self._load_vad_model)
-                ),
-            ]
-
-            # 启动所有线程
-            for thread in threads:
-                thread.start()
-
-            # 等待所有线程完成，设置超时
-            for thread in threads:
-                thread.join(timeout=300)  # 5分钟超时
-                if thread.is_alive():
-                    logger.error(f"模型加载线程超时")
-                    return {
-                        "success": False,
-                        "error": "模型加载超时",
-                        "type": "timeout_error",
-                    }
-
-            # 检查加载结果
-            failed_models = [name for name, success in results.items() if not success]
-
-            if failed_models:
-                error_msg = f"以下模型加载失败: {', '.join(failed_models)}"
+            # Fun-ASR-Nano-2512 已自带标点，不需要 punc 模型；VAD 随 ASR 模型一起加载
+            if not self._load_asr_model():
+                error_msg = "以下模型加载失败: asr"
                 logger.error(error_msg)
                 return {"success": False, "error": error_msg, "type": "init_error"}
 
             total_time = time.time() - start_time
             self.initialized = True
-            logger.info(
-                f"所有FunASR模型并行初始化完成，总耗时: {total_time:.2f}秒"
-            )
+            logger.info(f"FunASR模型初始化完成，总耗时: {total_time:.2f}秒")
+
+            # cuDNN 算法选择、torch.compile 编译、fbank 计算等一次性开销在这里提前付清，
+            # 不让第一次真实转录承担；预热失败不影响初始化结果
+            self._warmup()
             return {
                 "success": True,
-                "message": f"FunASR模型并行初始化成功，耗时: {total_time:.2f}秒",
+                "message": f"FunASR模型初始化成功，耗时: {total_time:.2f}秒",
             }
 
-        except ImportError as e:
-            error_msg = "FunASR未安装，请先安装FunASR: pip install funasr"
-            logger.error(error_msg)
-            return {"success": False, "error": error_msg, "type": "import_error"}
-
         except Exception as e:
             error_msg = f"FunASR模型初始化失败: {str(e)}"
-            logger.error(error_msg)
-            logger.error(traceback.format_exc())
+            logger.exception(error_msg)
             return {"success": False, "error": error_msg, "type": "init_error"}
 
     def transcribe_audio(self, audio_path, options=None):
@@ -242,97 +362,225 @@ class FunASRServer:
                 return init_result
 
         try:
-            # 检查音频文件是否存在
-            if not os.path.exists(audio_path):
+            audio_input = self._prepare_input(audio_path)
+            if audio_input is None:
                 return {"success": False, "error": f"音频文件不存在: {audio_path}"}
 
             logger.info(f"开始转录音频文件: {audio_path}")
+            asr_result = self._generate([audio_input["input"]], self._merge_options(options))
+            return self._build_result(
+                audio_path, asr_result[0] if asr_result else asr_result, audio_input["duration"]
+            )
 
-            # 设置默认选项
-            # Fun-ASR-Nano-2512 模型已经自带标点输出，不需要额外的 punc 模型
-            default_options = {
-                "batch_size_s": 60,
-                "hotword": "",
-                "use_vad": True,
-                "language": "zh",
-            }
+        except Exception as e:
+            return self._transcription_error(e)
 
-            if options:
-                default_options.update(options)
+    def transcribe_batch(self, commands):
+        """批量转录：推理参数相同的请求合并为一次 generate 调用，结果按请求顺序返回"""
+        if len(commands) == 1:
+            command = commands[0]
+            return [self.transcribe_audio(command.get("audio_path"), command.get("options", {}))]
 
-            # 执行语音识别
-            if default_options["use_vad"]:
-                vad_result = self.vad_model.generate(
-                    input=audio_path, batch_size_s=default_options["batch_size_s"]
-                )
-                logger.info("VAD处理完成")
+        if not self.initialized:
+            init_result = self.initialize()
+            if not init_result["success"]:
+                return [init_result] * len(commands)
+
+        results = [None] * len(commands)
+        groups = {}
+        for i, command in enumerate(commands):
+            try:
+                options = self._merge_options(command.get("options", {}))
+                group_key = (options["batch_size_s"], options["hotword"])
+                groups.setdefault(group_key, []).append((i, command.get("audio_path"), options))
+            except Exception as e:
+                results[i] = self._transcription_error(e)
+
+        # 解码按分组顺序提交到后台线程：前一组 generate 期间，后一组的音频已在解码
+        prepared = {
+            i: self._prefetcher.submit(self._prepare_input, audio_path)
+            for group in groups.values()
+            for i, audio_path, _ in group
+        }
+
+        for group in groups.values():
+            members = []
+            for i, audio_path, _ in group:
+                try:
+                    audio_input = prepared[i].result()
+                except Exception as e:
+                    results[i] = self._transcription_error(e)
+                    continue
+                if audio_input is None:
+                    results[i] = {"success": False, "error": f"音频文件不存在: {audio_path}"}
+                    continue
+                members.append((i, audio_path, audio_input))
+            if not members:
+                continue
+
+            inputs = [audio_input["input"] for _, _, audio_input in members]
+            logger.info(f"合批转录 {len(inputs)} 个音频")
+            try:
+                asr_result = self._generate(inputs, group[0][2])
+                for (i, audio_path, audio_input), item in zip(members, asr_result):
+                    results[i] = self._build_result(audio_path, item, audio_input["duration"])
+            except Exception as e:
+                for i, _, _ in members:
+                    results[i] = self._transcription_error(e)
+
+        return results
+
+    def _merge_options(self, options):
+        """合并转录选项与默认值；未传选项时直接返回只读的默认选项"""
+        if not options:
+            return self._DEFAULT_OPTIONS
+        merged = {**self._DEFAULT_OPTIONS, **options}
+        hotword = merged["hotword"]
+        if isinstance(hotword, (list, tuple)):
+            # FunASR 的热词是空格分隔的字符串；统一成字符串后也可作为合批分组键
+            merged["hotword"] = " ".join(str(word) for word in hotword)
+        elif hotword is None:
+            merged["hotword"] = ""
+        return merged
+
+    def _prepare_input(self, audio_path):
+        """一次 os.stat 同时完成存在性检查和缓存键计算；文件不存在时返回 None
+
+        soundfile 能解码的音频在这里解码（非 16kHz 时重采样）并缓存，重复转录同一文件时直接复用波形；
+        soundfile 无法解码的格式仍把路径交给 FunASR 处理。
+        """
+        try:
+            st = os.stat(audio_path)
+        except FileNotFoundError:
+            return None
 
-            # 执行ASR识别
+        key = (audio_path, st.st_size, st.st_mtime_ns)
+        cached = self._pcm_cache.get(key)
+        if cached is not None:
+            self._pcm_cache.move_to_end(key)
+            waveform, duration, _ = cached
+            return {"input": waveform, "duration": duration}
+
+        try:
+            info = sf.info(audio_path)
+        except Exception:
+            return {"input": audio_path, "duration": None}
+        duration = info.frames / info.samplerate
+        needs_resample = info.samplerate != MODEL_SAMPLE_RATE
+        if needs_resample and torchaudio is None:
+            return {"input": audio_path, "duration": duration}
+
+        buffer = None
+        if info.channels == 1 and not needs_resample:
+            # 单声道直接解码进缓冲池中的数组，避免每次转录都分配新的波形内存
+            buffer = self._pcm_pool.acquire(info.frames)
+            pcm = sf.read(audio_path, dtype="float32", out=buffer[: info.frames])
+        else:
+            data, _ = sf.read(audio_path, dtype="float32", always_2d=True)
+            pcm = data[:, 0] if info.channels == 1 else data.mean(axis=1)
+        waveform = torch.from_numpy(pcm)
+        duration = len(pcm) / info.samplerate
+        if needs_resample:
+            waveform = self._get_resampler(info.samplerate)(waveform)
+        self._pcm_cache[key] = (waveform, duration, buffer)
+        # 被淘汰的波形不再被引用（缓存容量不小于单批命令数），其缓冲区归还缓冲池
+        while len(self._pcm_cache) > PCM_CACHE_SIZE:
+            _, (_, _, evicted_buffer) = self._pcm_cache.popitem(last=False)
+            self._pcm_pool.release(evicted_buffer)
+        return {"input": waveform, "duration": duration}
+
+    def _get_resampler(self, sample_rate):
+        """按源采样率缓存重采样器，sinc 插值核只在第一次遇到该采样率时计算"""
+        resampler = self._resamplers.get(sample_rate)
+        if resampler is None:
+            resampler = torchaudio.transforms.Resample(sample_rate, MODEL_SAMPLE_RATE)
+            self._resamplers[sample_rate] = resampler
+        return resampler
+
+    def _generate(self, audio_inputs, options):
+        """执行ASR识别（内部先做 VAD 切分），返回与 audio_inputs 一一对应的结果列表"""
+        try:
             asr_result = self.asr_model.generate(
-                input=audio_path,
-                batch_size_s=default_options["batch_size_s"],
-                hotword=default_options["hotword"],
-                cache={},
+                input=audio_inputs[0] if len(audio_inputs) == 1 else audio_inputs,
+                batch_size_s=options["batch_size_s"],
+                hotword=options["hotword"],
+                llm_kwargs=self._llm_kwargs,
+                cache=self._asr_cache,
             )
+        finally:
+            self._asr_cache.clear()
+        if not isinstance(asr_result, list):
+            return [asr_result]
+        if len(audio_inputs) > 1 and len(asr_result) != len(audio_inputs):
+            raise RuntimeError(f"批量识别结果数量不匹配: {len(asr_result)} != {len(audio_inputs)}")
+        return asr_result
+
+    def _build_result(self, audio_path, item, duration=None):
+        """由单条识别结果组装响应，并更新统计（duration 为 None 时读取文件头获取时长）"""
+        # 提取识别文本
+        if isinstance(item, dict) and "text" in item:
+            raw_text = item["text"]
+        else:
+            raw_text = str(item)
 
-            # 提取识别文本
-            if isinstance(asr_result, list) and len(asr_result) > 0:
-                if isinstance(asr_result[0], dict) and "text" in asr_result[0]:
-                    raw_text = asr_result[0]["text"]
-                else:
-                    raw_text = str(asr_result[0])
-            else:
-                raw_text = str(asr_result)
-
-            logger.info(f"ASR识别完成，文本: {raw_text[:100]}...")
+        logger.info(f"ASR识别完成，文本: {raw_text[:100]}...")
 
+        if duration is None:
             duration = self._get_audio_duration(audio_path)
-            self.transcription_count += 1
-
-            result = {
-                "success": True,
-                "text": raw_text,
-                "confidence": (
-                    getattr(asr_result[0], "confidence", 0.0)
-                    if isinstance(asr_result, list)
-                    else 0.0
-                ),
-                "duration": duration,
-                "language": "zh-CN",
-                "model_type": "pytorch",
-            }
+        else:
+            self.total_audio_duration += duration
+        self.transcription_count += 1
+
+        result = {
+            "success": True,
+            "text": raw_text,
+            "confidence": getattr(item, "confidence", 0.0),
+            "duration": duration,
+            "language": "zh-CN",
+            "model_type": "pytorch",
+        }
 
-            # 生产环境：每10次转录后进行内存清理
-            if self.transcription_count % 10 == 0:
-                self._cleanup_memory()
-                logger.info(f"已完成 {self.transcription_count} 次转录，执行内存清理")
+        # 热路径不做 gc；只在缓存分配器积压的空闲显存过多时归还
+        self._release_cuda_cache_if_needed()
 
-            logger.info(f"转录完成: {raw_text[:100]}...")
-            return result
+        logger.info(f"转录完成: {raw_text[:100]}...")
+        return result
 
-        except Exception as e:
-            error_msg = f"音频转录失败: {str(e)}"
-            logger.error(error_msg)
-            logger.error(traceback.format_exc())
-            return {"success": False, "error": error_msg, "type": "transcription_error"}
+    def _transcription_error(self, e):
+        """记录转录异常并构造错误响应"""
+        error_msg = f"音频转录失败: {str(e)}"
+        logger.exception(error_msg)
+        return {"success": False, "error": error_msg, "type": "transcription_error"}
 
     def _get_audio_duration(self, audio_path):
-        """获取音频时长"""
+        """获取音频时长：优先读取文件头，soundfile 无法识别的格式再回退到 librosa"""
         try:
-            import librosa
-
-            duration = librosa.get_duration(filename=audio_path)
-            self.total_audio_duration += duration  # 累计音频时长
-            return duration
-        except:
-            return 0.0
-
-    def _cleanup_memory(self):
-        """生产环境内存清理"""
+            info = sf.info(audio_path)
+            duration = info.frames / info.samplerate
+        except Exception:
+            try:
+                duration = librosa.get_duration(path=audio_path)
+            except Exception:
+                return 0.0
+        self.total_audio_duration += duration  # 累计音频时长
+        return duration
+
+    def _release_cuda_cache_if_needed(self):
+        """空闲缓存显存超过 CUDA_CACHE_SLACK_BYTES 时调用 empty_cache：
+        empty_cache 会同步设备，且之后的分配需要重新向驱动申请，不宜固定频率调用"""
+        if not self._has_cuda():
+            return
+        slack = torch.cuda.memory_reserved() - torch.cuda.memory_allocated()
+        if slack > CUDA_CACHE_SLACK_BYTES:
+            torch.cuda.empty_cache()
+            logger.info(f"空闲缓存显存 {slack / 1024 ** 2:.0f} MiB，已归还")
+
+    def _cleanup_memory(self, release_cuda=False):
+        """生产环境内存清理；release_cuda 为 True 时同时释放 CUDA 缓存分配器中的空闲显存"""
         try:
-            import gc
-
             gc.collect()
+            if release_cuda and self._has_cuda():
+                torch.cuda.empty_cache()
             logger.info("内存清理完成")
         except Exception as e:
             logger.warning(f"内存清理失败: {str(e)}")
@@ -348,50 +596,61 @@ class FunASRServer:
             "initialized": self.initialized,
             "models_loaded": {
                 "asr": self.asr_model is not None,
-                "vad": self.vad_model is not None,
+                "vad": self.asr_model is not None,  # VAD 随 ASR 模型加载
             },
         }
 
     def check_status(self):
         """检查FunASR状态"""
-        try:
-            import funasr
-
-            return {
-                "success": True,
-                "installed": True,
-                "initialized": self.initialized,
-                "version": getattr(funasr, "__version__", "unknown"),
-                "models": {
-                    "asr": self.asr_model is not None,
-                    "vad": self.vad_model is not None,
-                },
-            }
-        except ImportError:
+        if funasr is None:
             return {
                 "success": False,
                 "installed": False,
                 "initialized": False,
                 "error": "FunASR未安装",
             }
+        return {
+            "success": True,
+            "installed": True,
+            "initialized": self.initialized,
+            "version": getattr(funasr, "__version__", "unknown"),
+            "models": {
+                "asr": self.asr_model is not None,
+                "vad": self.asr_model is not None,  # VAD 随 ASR 模型加载
+            },
+        }
+
+    def _handle_cleanup(self, command):
+        """cleanup：清理内存并释放 CUDA 缓存"""
+        self._cleanup_memory(release_cuda=True)
+        return {"success": True, "message": "内存清理完成"}
 
     def run(self):
         """运行服务器主循环"""
         logger.info("FunASR服务器启动")
 
+        # 直接写 stdout 文件描述符，使用 64 KiB 缓冲，每批响应只 flush 一次
+        self._out = io.BufferedWriter(
+            io.FileIO(sys.stdout.fileno(), "wb", closefd=False), buffer_size=IO_BUFFER_SIZE
+        )
+
         # 解析 ModelScope 模型缓存根目录（不含组织名）
         def _default_models_root():
             root = os.environ.get("MODELSCOPE_CACHE")
             if root:
-                # 兼容多种布局
-                candidates = [
-                    os.path.join(root, "hub", "models"),
-                    os.path.join(root, "models"),
-                    root,
-                ]
-                for c in candidates:
-                    if os.path.isdir(c):
-                        return c
+                # 兼容多种布局：一次 scandir 拿到根目录下的子目录，避免逐个候选路径 stat
+                try:
+                    with os.scandir(root) as it:
+                        subdirs = {e.name for e in it if e.is_dir()}
+                except OSError:
+                    subdirs = None
+                if subdirs is not None:
+                    hub_models = os.path.join(root, "hub", "models")
+                    if "hub" in subdirs and os.path.isdir(hub_models):
+                        return hub_models
+                    if "models" in subdirs:
+                        return os.path.join(root, "models")
+                    return root
             # 默认回到用户主目录的 modelscope/hub/models
             home_dir = os.path.expanduser("~")
             return os.path.join(home_dir, ".cache", "modelscope", "hub", "models")
@@ -406,17 +665,12 @@ class FunASRServer:
         ]
 
         def _repo_ready(repo_dir):
-            # 目录存在且包含任意常见权重/配置文件即认为已就绪
-            if not os.path.isdir(repo_dir):
+            # 目录存在且包含任意常见权重/配置文件即认为已就绪；一次 scandir 匹配全部模式
+            try:
+                with os.scandir(repo_dir) as it:
+                    return any(MODEL_FILE_PATTERN.match(entry.name) for entry in it)
+            except OSError:
                 return False
-            patterns = [
-                "model.pt", "pytorch_model.bin", "*.onnx",
-                "config.json", "configuration.json", "model.yaml", "vocab*"
-            ]
-            for pat in patterns:
-                if glob.glob(os.path.join(repo_dir, pat)):
-                    return True
-            return False
 
         missing = []
         for r in repos:
@@ -434,65 +688,45 @@ class FunASRServer:
                 "error": "模型文件未下载，请先下载模型",
                 "type": "models_not_downloaded"
             }
-        print(json.dumps(init_result, ensure_ascii=False))
-        sys.stdout.flush()
+        self._emit(init_result)
+        self._out.flush()
 
+        reader_class = StdinFrameReader if self.framing == "length" else StdinLineReader
+        reader = reader_class(sys.stdin)
         while self.running:
             try:
                 # 读取命令
-                line = sys.stdin.readline()
+                line = reader.readline()
                 if not line:
                     break
 
-                line = line.strip()
-                if not line:
-                    continue
-
-                try:
-                    command = json.loads(line)
-                except json.JSONDecodeError:
-                    result = {"success": False, "error": "无效的JSON命令"}
-                    print(json.dumps(result, ensure_ascii=False))
-                    sys.stdout.flush()
-                    continue
-
-                # 处理命令
-                if command.get("action") == "transcribe":
-                    audio_path = command.get("audio_path")
-                    options = command.get("options", {})
-                    result = self.transcribe_audio(audio_path, options)
-                elif command.get("action") == "status":
-                    result = self.check_status()
-                elif command.get("action") == "stats":
-                    result = {"success": True, "stats": self.get_performance_stats()}
-                elif command.get("action") == "cleanup":
-                    self._cleanup_memory()
-                    result = {"success": True, "message": "内存清理完成"}
-                elif command.get("action") == "exit":
-                    result = {"success": True, "message": "服务器退出"}
-                    print(json.dumps(result, ensure_ascii=False))
-                    sys.stdout.flush()
-                    break
-                else:
-                    result = {
-                        "success": False,
-                        "error": f"未知命令: {command.get('action')}",
-                    }
+                # 收到第一条命令后，在批处理窗口内继续收集已到达的命令
+                lines = [line]
+                while len(lines) < MAX_BATCH_SIZE:
+                    next_line = reader.readline(timeout=BATCH_WINDOW_SECONDS)
+                    if not next_line:
+                        break
+                    lines.append(next_line)
 
-                # 输出结果
-                print(json.dumps(result, ensure_ascii=False))
-                sys.stdout.flush()
+                # 整批响应写入缓冲区后只 flush 一次
+                for result in self._handle_lines(lines):
+                    self._emit(result)
+                self._out.flush()
 
             except KeyboardInterrupt:
                 break
             except Exception as e:
+                logger.exception(f"命令处理失败: {str(e)}")
                 error_result = {
                     "success": False,
                     "error": str(e),
-                    "traceback": traceback.format_exc(),
+                    "error_type": type(e).__name__,
                 }
-                print(json.dumps(error_result, ensure_ascii=False))
-                sys.stdout.flush()
+                # 完整调用栈只在调试模式下随响应返回，平时只写日志
+                if self.debug:
+                    error_result["traceback"] = traceback.format_exc()
+                self._emit(error_result)
+                self._out.flush()
 
         logger.info("FunASR服务器退出")
 
@@ -500,7 +734,15 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--damo-root", type=str, default=None,
                         help="ModelScope 模型缓存根目录，例如 ~/.cache/modelscope/hub/models")
+    parser.add_argument("--framing", type=str, default="line", choices=["line", "length"],
+                        help="IPC 分帧方式: line（每行一条 JSON，默认）或 length（4 字节大端长度前缀）")
+    parser.add_argument("--debug", action="store_true",
+                        help="调试模式：错误响应中附带完整 traceback")
+    parser.add_argument("--quant", type=str, default="none", choices=["none", "int8"],
+                        help="权重量化: none（默认）或 int8（CPU 动态量化全部 Linear，CUDA 量化 LLM 前馈层）")
     args = parser.parse_args()
 
-    server = FunASRServer(damo_root=args.damo_root)
+    server = FunASRServer(
+        damo_root=args.damo_root, framing=args.framing, debug=args.debug, quant=args.quant
+    )
     server.run()
\ No newline at end of file
@@ -15,6 +15,7 @@ class EmbeddedPythonBuilder {
     this.buildDate = '20231002';
     this.pythonDir = path.join(__dirname, '..', 'python');
     this.forceReinstall = false;
+    this.trashRemoval = null; // 后台删除旧 Python 目录的 Promise
   }
 
   async build() {
@@ -51,6 +52,12 @@ class EmbeddedPythonBuilder {
       
       // 3. 下载Python运行时
       await this.downloadPythonRuntime();
+
+      // 后台删除只能在事件循环空闲时推进（下载期间），
+      // 后续依赖安装使用 execSync 会阻塞事件循环，因此在安装前等待删除完成
+      if (this.trashRemoval) {
+        await this.trashRemoval;
+      }
       
       // 4. 安装Python依赖
       await this.installDependencies();
@@ -62,14 +69,41 @@ class EmbeddedPythonBuilder {
       
     } catch (error) {
       console.error('❌ 准备Python环境失败:', error.message);
+      // process.exit 会中止尚未完成的后台删除，失败时也要等旧目录删完再退出
+      if (this.trashRemoval) {
+        await this.trashRemoval;
+      }
       process.exit(1);
     }
   }
 
   async cleanup() {
+    // 之前被中断的构建可能留下 python.trash-<pid> 目录，与本次的旧目录一起删除
+    const parentDir = path.dirname(this.pythonDir);
+    const trashPrefix = `${path.basename(this.pythonDir)}.trash-`;
+    const trashDirs = fs.readdirSync(parentDir)
+      .filter((name) => name.startsWith(trashPrefix))
+      .map((name) => path.join(parentDir, name));
+
     if (fs.existsSync(this.pythonDir)) {
       console.log('🧹 清理现有Python目录...');
-      fs.rmSync(this.pythonDir, { recursive: true, force: true });
+      // 旧目录里有 torch 等数万个文件，同步删除会阻塞很久：
+      // 先改名移开，下载期间在后台删除；改名失败时退回同步删除
+      const trashDir = `${this.pythonDir}.trash-${process.pid}`;
+      try {
+        fs.renameSync(this.pythonDir, trashDir);
+        trashDirs.push(trashDir);
+      } catch (error) {
+        fs.rmSync(this.pythonDir, { recursive: true, force: true });
+      }
+    }
+
+    if (trashDirs.length > 0) {
+      this.trashRemoval = Promise.all(
+        trashDirs.map((dir) => fs.promises
+          .rm(dir, { recursive: true, force: true })
+          .catch((error) => console.warn('⚠️ 删除旧Python目录失败:', error.message)))
+      );
     }
     fs.mkdirSync(this.pythonDir, { recursive: true });
   }
@@ -177,6 +211,36 @@ class EmbeddedPythonBuilder {
       'funasr>=1.2.7'
     ];
 
+    // 优先一次 pip 调用装完全部依赖：只启动一个解释器、只做一次依赖解析，并优先使用 wheel
+    console.log('📦 批量安装全部依赖...');
+    try {
+      const batchEnv = {
+        ...process.env,
+        PYTHONHOME: this.pythonDir,
+        PYTHONPATH: sitePackagesPath,
+        PYTHONDONTWRITEBYTECODE: '1',
+        PYTHONIOENCODING: 'utf-8',
+        PYTHONUNBUFFERED: '1',
+        PIP_NO_CACHE_DIR: '1',
+        LD_LIBRARY_PATH: path.join(this.pythonDir, 'lib'),
+        DYLD_LIBRARY_PATH: path.join(this.pythonDir, 'lib'),
+      };
+      delete batchEnv.PYTHONUSERBASE;
+      delete batchEnv.PYTHONSTARTUP;
+      delete batchEnv.VIRTUAL_ENV;
+
+      const depArgs = dependencies.map(dep => `"${dep}"`).join(' ');
+      execSync(`"${pythonPath}" -m pip install --target "${sitePackagesPath}" --upgrade --prefer-binary ${depArgs}`, {
+        stdio: 'inherit',
+        env: batchEnv
+      });
+      console.log('✅ 全部依赖安装完成');
+      await this.verifyDependencies(pythonPath);
+      return;
+    } catch (error) {
+      console.warn('⚠️ 批量安装失败，改为逐个安装:', error.message);
+    }
+
     // 逐个安装依赖（包含所有子依赖）
     for (const dep of dependencies) {
       console.log(`📦 安装 ${dep}...`);
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+安装 / 模型下载脚本的公共部分
+JSON 进度输出（供 Electron 逐行解析）和 ModelScope 模型仓库下载
+"""
+
+import sys
+import json
+import os
+import threading
+
+try:
+    import orjson
+
+    def _dumps_json(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    def _dumps_json(obj):
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+# 单个模型仓库内并行下载文件的线程数
+DOWNLOAD_WORKERS = 8
+# 单个文件超过该大小（MB）时分片并行下载
+PARALLEL_DOWNLOAD_THRESHOLD_MB = 64
+
+_emit_lock = threading.Lock()
+
+
+def emit_json(obj):
+    """输出一行 JSON：UTF-8 字节整行一次写入 stdout 并立即 flush，多线程输出时也不会交错"""
+    payload = _dumps_json(obj) + b"\n"
+    with _emit_lock:
+        sys.stdout.buffer.write(payload)
+        sys.stdout.buffer.flush()
+
+
+def output_progress(stage, message, progress=0, error=None):
+    """输出进度信息（JSON 格式，供 Electron 解析）"""
+    status = {
+        "stage": stage,
+        "message": message,
+        "progress": progress,
+    }
+    if error:
+        status["error"] = error
+    emit_json(status)
+
+
+def set_download_only_env():
+    """只为下载而构建模型时，在导入 funasr / torch 之前调用：
+    隐藏 GPU 跳过 CUDA 初始化探测，并关闭 transformers / tokenizers 的提示和并行"""
+    os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+    os.environ.setdefault("TORCH_CPP_LOG_LEVEL", "ERROR")
+    os.environ.setdefault("TRANSFORMERS_NO_ADVISORY_WARNINGS", "1")
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def snapshot_model(model_name, revision=None):
+    """只下载模型仓库文件（不构建模型）到 ModelScope 默认缓存；modelscope 不可用时返回 False"""
+    # 超过阈值的大文件（如约 2GB 的 model.pt）按 HTTP Range 分片并行下载；
+    # modelscope 在导入时读取这些环境变量
+    os.environ.setdefault("MODELSCOPE_PARALLEL_DOWNLOAD_THRESHOLD_MB", str(PARALLEL_DOWNLOAD_THRESHOLD_MB))
+    os.environ.setdefault("MODELSCOPE_DOWNLOAD_PARALLELS", str(DOWNLOAD_WORKERS))
+
+    try:
+        from modelscope.hub.snapshot_download import snapshot_download
+    except ImportError:
+        return False
+
+    kwargs = {"revision": revision} if revision else {}
+    try:
+        snapshot_download(model_name, max_workers=DOWNLOAD_WORKERS, **kwargs)
+    except TypeError:
+        # 旧版 modelscope 不支持 max_workers
+        snapshot_download(model_name, **kwargs)
+    return True
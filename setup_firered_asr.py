@@ -6,20 +6,8 @@ FireRedASR 自动安装脚本
 """
 
 import sys
-import json
 
-
-def output_progress(stage, message, progress=0, error=None):
-    """输出进度信息（JSON 格式，供 Electron 解析）"""
-    status = {
-        "stage": stage,
-        "message": message,
-        "progress": progress,
-    }
-    if error:
-        status["error"] = error
-    print(json.dumps(status, ensure_ascii=False))
-    sys.stdout.flush()
+from setup_common import emit_json, output_progress
 
 
 def verify_installation():
@@ -50,7 +38,7 @@ def main():
             "error": "fireredasr 未安装，请运行: uv sync",
         }
 
-    print(json.dumps(result, ensure_ascii=False))
+    emit_json(result)
     sys.exit(0 if result["success"] else 1)
 
 
@@ -58,8 +46,8 @@ if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
-        print(json.dumps({"success": False, "error": "用户取消"}))
+        emit_json({"success": False, "error": "用户取消"})
         sys.exit(1)
     except Exception as e:
-        print(json.dumps({"success": False, "error": str(e)}))
+        emit_json({"success": False, "error": str(e)})
         sys.exit(1)
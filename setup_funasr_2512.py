@@ -8,36 +8,126 @@ Fun-ASR-Nano-2512 自动安装脚本
 import sys
 import json
 import os
+import hashlib
+import shutil
+from functools import lru_cache
 from pathlib import Path
 
-
-def output_progress(stage, message, progress=0, error=None):
-    """输出进度信息（JSON 格式，供 Electron 解析）"""
-    status = {
-        "stage": stage,
-        "message": message,
-        "progress": progress,
-    }
-    if error:
-        status["error"] = error
-    print(json.dumps(status, ensure_ascii=False))
-    sys.stdout.flush()
+from setup_common import emit_json, output_progress, set_download_only_env, snapshot_model
 
 
+@lru_cache(maxsize=1)
 def get_project_root():
     """获取项目根目录"""
     return Path(__file__).parent
 
 
+# 模型文件旁记录 size / mtime_ns / sha256 的元数据文件后缀
+MODEL_META_SUFFIX = ".meta.json"
+# 下载模型仓库所需的磁盘空间（model.pt 约 2GB，另含 LLM 配置 / 分词器等文件）
+MODEL_DOWNLOAD_BYTES = 2_500_000_000
+# 上次验证通过时的文件状态；与当前一致时跳过验证
+VERIFIED_SENTINEL = Path.home() / ".cache" / "ququ" / "verified.json"
+
+
+@lru_cache(maxsize=1)
+def get_model_file():
+    """ModelScope 缓存中的 model.pt 路径"""
+    ms_cache = Path.home() / ".cache" / "modelscope" / "hub" / "models"
+    return ms_cache / "FunAudioLLM" / "Fun-ASR-Nano-2512" / "model.pt"
+
+
+def file_sha256(path):
+    """计算文件 SHA-256：hashlib.file_digest 在 C 层流式读取并释放 GIL，比 Python 分块循环快"""
+    with open(path, "rb", buffering=0) as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def model_file_unchanged(model_file):
+    """model.pt 与上次下载后记录的元数据一致时返回 True：
+    size 和 mtime 都相同直接认为完整；仅 mtime 变化时重新计算哈希比对，一致则刷新 mtime"""
+    meta_path = model_file.with_name(model_file.name + MODEL_META_SUFFIX)
+    try:
+        st = os.stat(model_file)
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    if meta.get("size") != st.st_size:
+        return False
+    if meta.get("mtime_ns") == st.st_mtime_ns:
+        return True
+    if meta.get("sha256") != file_sha256(model_file):
+        return False
+
+    meta["mtime_ns"] = st.st_mtime_ns
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return True
+
+
+def write_model_meta(model_file):
+    """下载完成后记录 model.pt 的 size / mtime_ns / sha256"""
+    try:
+        st = os.stat(model_file)
+        meta = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha256": file_sha256(model_file),
+        }
+        meta_path = model_file.with_name(model_file.name + MODEL_META_SUFFIX)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+    except OSError:
+        pass
+    # 模型重新下载过，之前的验证结果作废
+    try:
+        os.remove(VERIFIED_SENTINEL)
+    except OSError:
+        pass
+
+
+def installed_file_state(model_py, model_file):
+    """funasr_model.py 和 model.pt 的当前状态，任一文件缺失时返回 None"""
+    try:
+        model_st = os.stat(model_file)
+        model_py_st = os.stat(model_py)
+    except OSError:
+        return None
+    return {
+        "model_pt_size": model_st.st_size,
+        "model_pt_mtime_ns": model_st.st_mtime_ns,
+        "funasr_model_py_mtime_ns": model_py_st.st_mtime_ns,
+    }
+
+
+def read_verified_state():
+    """读取上次验证通过时记录的文件状态"""
+    try:
+        with open(VERIFIED_SENTINEL, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_verified_state(state):
+    """记录验证通过时的文件状态（先写临时文件再 os.replace，保证原子）"""
+    try:
+        os.makedirs(VERIFIED_SENTINEL.parent, exist_ok=True)
+        tmp_path = VERIFIED_SENTINEL.with_name(VERIFIED_SENTINEL.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, VERIFIED_SENTINEL)
+    except OSError:
+        pass
+
+
 def download_model():
     """下载 Fun-ASR-Nano-2512 模型"""
     output_progress("download", "正在下载 Fun-ASR-Nano-2512 模型...", 10)
 
     try:
-        from funasr import AutoModel
-
-        output_progress("download", "初始化模型下载...", 20)
-
         # 使用本地优化过的 model.py
         project_root = get_project_root()
         model_py_path = str(project_root / "funasr_model.py")
@@ -46,8 +136,40 @@ def download_model():
             output_progress("download", "funasr_model.py 不存在", 0, "模型代码文件缺失")
             return False
 
+        # 已下载且未变化时跳过（ModelScope 会重新校验整个仓库）
+        model_file = get_model_file()
+        if model_file_unchanged(model_file):
+            output_progress("download", "模型已存在，跳过下载", 100)
+            return True
+
+        # 下载前检查磁盘空间，避免传输大半后才因空间不足失败；
+        # 模型目录可能尚不存在，检查最近的已存在上级目录所在磁盘，不提前创建目录
+        check_dir = model_file.parent
+        while not check_dir.exists() and check_dir != check_dir.parent:
+            check_dir = check_dir.parent
+        free = shutil.disk_usage(check_dir).free
+        if free < MODEL_DOWNLOAD_BYTES:
+            output_progress(
+                "download",
+                "磁盘空间不足",
+                0,
+                f"需要约 {MODEL_DOWNLOAD_BYTES / 1e9:.1f}GB 可用空间，当前仅剩 {free / 1e9:.1f}GB",
+            )
+            return False
+
         output_progress("download", "正在下载模型文件（约 2GB）...", 30)
 
+        # 直接多线程拉取模型仓库，不必为了下载在 CPU 上构建并加载整个模型
+        if snapshot_model("FunAudioLLM/Fun-ASR-Nano-2512"):
+            write_model_meta(model_file)
+            output_progress("download", "模型下载完成", 100)
+            return True
+
+        set_download_only_env()
+        from funasr import AutoModel
+
+        output_progress("download", "初始化模型下载...", 40)
+
         # 这会触发模型下载
         model = AutoModel(
             model="FunAudioLLM/Fun-ASR-Nano-2512",
@@ -55,6 +177,7 @@ def download_model():
             remote_code=model_py_path,
             device="cpu",  # 仅下载，使用 CPU
         )
+        write_model_meta(model_file)
 
         output_progress("download", "模型下载完成", 100)
         return True
@@ -64,58 +187,94 @@ def download_model():
         return False
 
 
-def verify_installation(project_root):
-    """验证安装是否成功"""
+def verify_installation(project_root, verify_hash=False):
+    """验证安装是否成功；verify_hash 为 True 时额外按下载时记录的 SHA-256 校验 model.pt"""
     output_progress("verify", "验证安装...", 50)
 
     model_py = project_root / "funasr_model.py"
 
     # 检查模型缓存
-    ms_cache = Path.home() / ".cache" / "modelscope" / "hub" / "models"
-    model_dir = ms_cache / "FunAudioLLM" / "Fun-ASR-Nano-2512"
-    model_file = model_dir / "model.pt"
+    model_file = get_model_file()
+
+    # 文件状态与上次验证通过时一致（哈希校验时还要求上次也校验过哈希）则直接通过
+    state = installed_file_state(model_py, model_file)
+    verified = read_verified_state() if state is not None else None
+    if verified is not None and all(verified.get(k) == v for k, v in state.items()):
+        if not verify_hash or verified.get("sha256_verified"):
+            output_progress("verify", "安装验证通过", 100)
+            return True
 
     issues = []
 
-    if not model_py.exists():
+    if not os.path.exists(model_py):
         issues.append("funasr_model.py 不存在")
 
-    if not model_file.exists():
+    # 一次目录扫描同时得到 model.pt 是否存在及其大小（空文件视为未下载）
+    try:
+        with os.scandir(model_file.parent) as it:
+            entries = {entry.name: entry for entry in it}
+    except OSError:
+        entries = {}
+    model_entry = entries.get(model_file.name)
+
+    if model_entry is None or model_entry.stat().st_size == 0:
         issues.append("模型文件未下载")
+    elif verify_hash:
+        output_progress("verify", "校验模型文件哈希...", 70)
+        meta_entry = entries.get(model_file.name + MODEL_META_SUFFIX)
+        expected = None
+        if meta_entry is not None:
+            try:
+                with open(meta_entry.path, "r", encoding="utf-8") as f:
+                    expected = json.load(f).get("sha256")
+            except (OSError, ValueError):
+                pass
+        if expected is None:
+            issues.append("缺少模型文件哈希记录")
+        elif file_sha256(model_file) != expected:
+            issues.append("模型文件哈希不匹配")
 
     if issues:
         output_progress("verify", "安装验证失败", 0, "; ".join(issues))
         return False
 
+    if state is not None:
+        write_verified_state(dict(state, sha256_verified=verify_hash))
     output_progress("verify", "安装验证通过", 100)
     return True
 
 
 def main():
     """主函数"""
-    import argparse
+    # 只带 --skip-model 的纯验证调用（自检、重试）不必导入 argparse 构建解析器
+    if sys.argv[1:] == ["--skip-model"]:
+        skip_model, verify_hash = True, False
+    else:
+        import argparse
 
-    parser = argparse.ArgumentParser(description="Fun-ASR-Nano-2512 自动安装")
-    parser.add_argument("--skip-model", action="store_true", help="跳过模型下载")
-    args = parser.parse_args()
+        parser = argparse.ArgumentParser(description="Fun-ASR-Nano-2512 自动安装")
+        parser.add_argument("--skip-model", action="store_true", help="跳过模型下载")
+        parser.add_argument("--verify-hash", action="store_true", help="验证时校验模型文件 SHA-256")
+        args = parser.parse_args()
+        skip_model, verify_hash = args.skip_model, args.verify_hash
 
     project_root = get_project_root()
 
     output_progress("start", "开始 Fun-ASR-Nano-2512 安装", 0)
 
     # 下载模型
-    if not args.skip_model:
+    if not skip_model:
         success = download_model()
         if not success:
-            print(json.dumps({
+            emit_json({
                 "success": False,
                 "error": "模型下载失败",
                 "hint": "请检查网络连接或手动下载模型"
-            }))
+            })
             sys.exit(1)
 
     # 验证安装
-    if verify_installation(project_root):
+    if verify_installation(project_root, verify_hash=verify_hash):
         result = {
             "success": True,
             "message": "Fun-ASR-Nano-2512 安装完成",
@@ -126,7 +285,7 @@ def main():
             "error": "安装验证失败",
         }
 
-    print(json.dumps(result, ensure_ascii=False))
+    emit_json(result)
     sys.exit(0 if result["success"] else 1)
 
 
@@ -134,8 +293,8 @@ if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
-        print(json.dumps({"success": False, "error": "用户取消"}))
+        emit_json({"success": False, "error": "用户取消"})
         sys.exit(1)
     except Exception as e:
-        print(json.dumps({"success": False, "error": str(e)}))
+        emit_json({"success": False, "error": str(e)})
         sys.exit(1)
@@ -18,6 +18,7 @@ class FireRedASRManager {
     this.serverReady = false;
     this.initializationPromise = null;
     this.transcriptionCount = 0;
+    this.fireRedInstalled = null; // 缓存安装状态（仅缓存检查通过的结果）
 
     // 模型配置
     this.modelType = "aed"; // aed (1.1B) 或 llm (8.3B)
@@ -141,6 +142,20 @@ class FireRedASRManager {
   }
 
   async checkFireRedASRInstallation() {
+    // 依赖检查要启动 Python 并导入 torch，耗时数秒；通过后缓存结果，
+    // 未通过不缓存，用户安装依赖后可以重新检测
+    if (this.fireRedInstalled) {
+      return this.fireRedInstalled;
+    }
+
+    const status = await this._probeFireRedASRInstallation();
+    if (status.installed) {
+      this.fireRedInstalled = status;
+    }
+    return status;
+  }
+
+  async _probeFireRedASRInstallation() {
     try {
       const pythonCmd = await this.findPythonExecutable();
       const env = this.buildPythonEnvironment();
@@ -276,11 +291,15 @@ class FireRedASRManager {
         });
 
         let initResponseReceived = false;
+        let pendingOutput = "";
 
+        // 按 UTF-8 解码并按行拼接：一行 JSON 可能跨多个 data 块到达
+        this.serverProcess.stdout.setEncoding("utf8");
         this.serverProcess.stdout.on("data", (data) => {
-          const lines = data.toString().split('\n').filter(line => line.trim());
+          const lines = (pendingOutput + data).split('\n');
+          pendingOutput = lines.pop();
 
-          for (const line of lines) {
+          for (const line of lines.filter(line => line.trim())) {
             try {
               const result = JSON.parse(line);
 
@@ -348,15 +367,23 @@ class FireRedASRManager {
 
     return new Promise((resolve, reject) => {
       let responseReceived = false;
+      let pendingOutput = "";
 
+      // stdout 已按 UTF-8 解码；分片转录会输出多行 partial，一行可能跨多个 data 块到达
       const onData = (data) => {
         if (responseReceived) return;
 
-        const lines = data.toString().split('\n').filter(line => line.trim());
+        const lines = (pendingOutput + data).split('\n');
+        pendingOutput = lines.pop();
 
-        for (const line of lines) {
+        for (const line of lines.filter(line => line.trim())) {
           try {
             const result = JSON.parse(line);
+            // 长音频分片转录时服务器会先输出 partial 事件，继续等待最终结果
+            if (result.type === 'partial') {
+              this.logger.debug && this.logger.debug('FireRedASR 分片结果:', result);
+              continue;
+            }
             responseReceived = true;
             this.serverProcess.stdout.removeListener('data', onData);
             resolve(result);
@@ -588,10 +615,14 @@ class FireRedASRManager {
       });
 
       let lastResult = null;
+      let pendingOutput = "";
 
+      // 按 UTF-8 解码并按行拼接：一行 JSON 可能跨多个 data 块到达
+      setupProcess.stdout.setEncoding("utf8");
       setupProcess.stdout.on("data", (data) => {
-        const lines = data.toString().split('\n').filter(line => line.trim());
-        for (const line of lines) {
+        const lines = (pendingOutput + data).split('\n');
+        pendingOutput = lines.pop();
+        for (const line of lines.filter(line => line.trim())) {
           try {
             const status = JSON.parse(line);
             lastResult = status;
@@ -472,17 +472,24 @@ class FunASRManager {
         });
         
         let hasError = false;
+        let pendingOutput = "";
         
+        // 按 UTF-8 解码并按行拼接：一行 JSON 可能跨多个 data 块到达
+        downloadProcess.stdout.setEncoding("utf8");
         downloadProcess.stdout.on("data", (data) => {
-          const lines = data.toString().split('\n').filter(line => line.trim());
+          const lines = (pendingOutput + data).split('\n');
+          pendingOutput = lines.pop();
+          const completeLines = lines.filter(line => line.trim());
           
-          for (const line of lines) {
+          for (const line of completeLines) {
             try {
               const result = JSON.parse(line);
               
               if (result.error) {
                 hasError = true;
                 reject(new Error(result.error));
+                // 已按失败返回，结束下载进程，不让其余模型线程继续占用网络
+                downloadProcess.kill();
                 return;
               }
               
@@ -523,6 +530,7 @@ class FunASRManager {
         });
         
         downloadProcess.on("close", (code) => {
+          clearTimeout(timeoutId);
           if (!hasError) {
             if (code === 0) {
               this.modelsDownloaded = true;
@@ -539,9 +547,10 @@ class FunASRManager {
           }
         });
         
-        // 设置超时（30分钟）
-        setTimeout(() => {
+        // 设置超时（30分钟）；进程退出时清除
+        const timeoutId = setTimeout(() => {
           if (!hasError) {
+            hasError = true;
             downloadProcess.kill();
             reject(new Error('模型下载超时'));
           }
@@ -150,10 +150,14 @@ class IPCHandlers {
         });
 
         let lastResult = null;
+        let pendingOutput = "";
 
+        // 按 UTF-8 解码并按行拼接：一行 JSON 可能跨多个 data 块到达
+        setupProcess.stdout.setEncoding("utf8");
         setupProcess.stdout.on("data", (data) => {
-          const lines = data.toString().split("\n").filter((line) => line.trim());
-          for (const line of lines) {
+          const lines = (pendingOutput + data).split("\n");
+          pendingOutput = lines.pop();
+          for (const line of lines.filter((line) => line.trim())) {
             try {
               const status = JSON.parse(line);
               lastResult = status;
@@ -252,10 +256,14 @@ class IPCHandlers {
         });
 
         let lastResult = null;
+        let pendingOutput = "";
 
+        // 按 UTF-8 解码并按行拼接：一行 JSON 可能跨多个 data 块到达
+        setupProcess.stdout.setEncoding("utf8");
         setupProcess.stdout.on("data", (data) => {
-          const lines = data.toString().split("\n").filter(Boolean);
-          for (const line of lines) {
+          const lines = (pendingOutput + data).split("\n");
+          pendingOutput = lines.pop();
+          for (const line of lines.filter(Boolean)) {
             try {
               const progress = JSON.parse(line);
               lastResult = progress;